@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Timing and memory benchmark for the comparison engine
+
+Runs Main._compute_data, Main._duplicates and Main._check_missing_dn
+against synthetic directories (benchmarks/directory.py) served by the
+in-process LDAP stand-in (benchmarks/fakeldap.py), for every combination
+of directory size and replica count.  Each step is timed over several
+repeats (median reported) and then run once more under tracemalloc for
+its peak allocation.  The generator is seeded, so runs are reproducible
+and can be compared against a saved baseline.
+
+Usage: python benchmarks/compute.py [--sizes N ...] [--replicas N ...]
+                                    [--json FILE] [--baseline FILE]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from directory import DOMAIN, generate  # noqa: E402
+from fakeldap import install  # noqa: E402
+from checkipaconsistency.main import Main  # noqa: E402
+
+STEPS = ['compute_data', 'duplicates', 'missing_dn']
+
+
+def build(directories, workers):
+    argv = ['-d', DOMAIN, '-W', 'benchmark', '-t', str(workers), '-H'] + [d.host for d in directories]
+    main = Main(argv)
+    # The AD trust check resolves DNS, which has no place in a repeatable run.
+    main._checks.pop('msdcs', None)
+    return main
+
+
+def compute_data(main):
+    for payload in main._servers.values():
+        payload.invalidate()
+    main._data = dict()
+    main._compute_data()
+
+
+def duplicates(main):
+    main._duplicates('users', True)
+
+
+def missing_dn(main):
+    main._check_missing_dn('users')
+
+
+def verify(main, truth):
+    users = main._data['checks']['users']
+    found = set()
+    for server in users['servers'].values():
+        found.update(server.get('missing_dn', []))
+    if found != truth.missing['users']:
+        return False
+    return set(users.get('duplicates', dict())) == truth.duplicates['users']
+
+
+def measure(fn, main, repeat):
+    times = list()
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        fn(main)
+        times.append(timeit.default_timer() - start)
+    times.sort()
+
+    tracemalloc.start()
+    fn(main)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return times[len(times) // 2], peak // 1024
+
+
+def run(args):
+    results = list()
+    for size in args.sizes:
+        for replicas in args.replicas:
+            directories, truth = generate(
+                replicas=replicas, users=size, missing=args.missing, duplicates=args.duplicates,
+                conflicts=args.conflicts, seed=args.seed
+            )
+            with install(directories, latency=args.latency):
+                main = build(directories, args.workers)
+                for step in STEPS:
+                    seconds, peak = measure(globals()[step], main, args.repeat)
+                    results.append({
+                        'size': size,
+                        'replicas': replicas,
+                        'step': step,
+                        'seconds': round(seconds, 4),
+                        'peak_kib': peak
+                    })
+                    print('{0:>8} users {1:>2} replicas  {2:<13} {3:9.3f}s {4:10d} KiB'.format(
+                        size, replicas, step, seconds, peak))
+                if not verify(main, truth):
+                    print('{0:>8} users {1:>2} replicas  results do not match the generated inconsistencies'.format(
+                        size, replicas))
+                    sys.exit(1)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    previous = dict(((r['size'], r['replicas'], r['step']), r) for r in baseline)
+    regressions = list()
+    for result in results:
+        old = previous.get((result['size'], result['replicas'], result['step']))
+        if not old:
+            continue
+        for metric in ['seconds', 'peak_kib']:
+            if old[metric] and result[metric] > old[metric] * (1 + tolerance):
+                regressions.append('{0} users {1} replicas {2}: {3} {4} -> {5}'.format(
+                    result['size'], result['replicas'], result['step'], metric, old[metric], result[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time and memory-profile the comparison engine')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--replicas', type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated round trip per LDAP operation')
+    parser.add_argument('--missing', type=float, default=0.001)
+    parser.add_argument('--duplicates', type=float, default=0.0005)
+    parser.add_argument('--conflicts', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', dest='json_file', help='write results to FILE')
+    parser.add_argument('--baseline', help='compare against results previously written with --json')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown before failing')
+    args = parser.parse_args()
+
+    os.environ['XDG_CONFIG_HOME'] = tempfile.mkdtemp()
+
+    results = run(args)
+
+    if args.json_file:
+        with open(args.json_file, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('regression: {0}'.format(regression))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Synthetic IPA directory generator
+
+Builds reproducible, IPA-shaped directories for a set of replicas with a
+controlled amount of inconsistency between them: entries missing on some
+replicas, entries sharing a name but carrying different ipaUniqueIDs, and
+replication conflict entries.
+
+Entries that are identical on every replica share one attribute dict, so
+a million users on eight replicas costs about as much as on one.
+
+Usage: python benchmarks/directory.py [--replicas N] [--users N] ...
+"""
+
+import argparse
+import random
+
+DOMAIN = 'ipa.example.com'
+
+
+class Directory(object):
+    def __init__(self, host, domain=DOMAIN):
+        self.host = host
+        self.domain = domain
+        self.base_dn = 'dc=' + domain.replace('.', ',dc=')
+        self.entries = dict()
+        self.children = dict()
+        self.down = False
+
+    def add(self, dn, attrs):
+        key = dn.lower()
+        if key not in self.entries:
+            parent = key.split(',', 1)[1] if ',' in key else ''
+            self.children.setdefault(parent, dict())[key] = None
+        self.entries[key] = (dn, attrs)
+
+    def remove(self, dn):
+        key = dn.lower()
+        if key not in self.entries:
+            return
+        del self.entries[key]
+        parent = key.split(',', 1)[1] if ',' in key else ''
+        del self.children[parent][key]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class Inconsistencies(object):
+    def __init__(self):
+        self.missing = dict()
+        self.duplicates = dict()
+        self.conflicts = dict()
+
+    def as_dict(self):
+        return {
+            'missing': dict((check, len(dns)) for check, dns in self.missing.items()),
+            'duplicates': dict((check, len(dns)) for check, dns in self.duplicates.items()),
+            'conflicts': sum(self.conflicts.values())
+        }
+
+
+def _hosts(replicas, domain):
+    return ['ipa{0:02d}.{1}'.format(i + 1, domain) for i in range(replicas)]
+
+
+def _containers(base_dn):
+    return [
+        'cn=accounts,{0}'.format(base_dn),
+        'cn=users,cn=accounts,{0}'.format(base_dn),
+        'cn=provisioning,{0}'.format(base_dn),
+        'cn=accounts,cn=provisioning,{0}'.format(base_dn),
+        'cn=staged users,cn=accounts,cn=provisioning,{0}'.format(base_dn),
+        'cn=deleted users,cn=accounts,cn=provisioning,{0}'.format(base_dn),
+        'cn=computers,cn=accounts,{0}'.format(base_dn),
+        'cn=services,cn=accounts,{0}'.format(base_dn),
+        'cn=groups,cn=accounts,{0}'.format(base_dn),
+        'cn=hostgroups,cn=accounts,{0}'.format(base_dn),
+        'cn=alt,{0}'.format(base_dn),
+        'cn=ng,cn=alt,{0}'.format(base_dn),
+        'cn=hbac,{0}'.format(base_dn),
+        'cn=hbacservices,cn=hbac,{0}'.format(base_dn),
+        'cn=hbacservicegroups,cn=hbac,{0}'.format(base_dn),
+        'cn=sudo,{0}'.format(base_dn),
+        'cn=sudorules,cn=sudo,{0}'.format(base_dn),
+        'cn=dns,{0}'.format(base_dn),
+        'cn=servers,cn=dns,{0}'.format(base_dn),
+        'ou=ca,o=ipaca',
+        'ou=certificateRepository,ou=ca,o=ipaca'
+    ]
+
+
+def _unique_id(rng):
+    return '{0:08x}-{1:04x}-{2:04x}-{3:04x}-{4:012x}'.format(
+        rng.getrandbits(32), rng.getrandbits(16), rng.getrandbits(16), rng.getrandbits(16), rng.getrandbits(48)
+    ).encode('utf-8')
+
+
+def _user(i, base_dn, rng):
+    uid = 'user{0:07d}'.format(i)
+    return 'uid={0},cn=users,cn=accounts,{1}'.format(uid, base_dn), {
+        'objectClass': [b'top', b'person', b'posixaccount', b'ipaobject'],
+        'uid': [uid.encode('utf-8')],
+        'cn': ['User {0}'.format(i).encode('utf-8')],
+        'ipaUniqueID': [_unique_id(rng)],
+        'entryUSN': [str(i + 1).encode('utf-8')],
+        'modifyTimestamp': [b'20240101000000Z']
+    }
+
+
+def _host(i, base_dn, domain, rng):
+    fqdn = 'host{0:07d}.{1}'.format(i, domain)
+    return 'fqdn={0},cn=computers,cn=accounts,{1}'.format(fqdn, base_dn), {
+        'objectClass': [b'top', b'ipahost', b'ipaobject'],
+        'fqdn': [fqdn.encode('utf-8')],
+        'cn': [fqdn.encode('utf-8')],
+        'ipaUniqueID': [_unique_id(rng)],
+        'entryUSN': [str(i + 1).encode('utf-8')],
+        'modifyTimestamp': [b'20240101000000Z']
+    }
+
+
+def _cert(i, domain):
+    return 'cn={0},ou=certificateRepository,ou=ca,o=ipaca'.format(i + 1), {
+        'objectClass': [b'top', b'certificateRecord'],
+        'serialno': ['{0:02d}{1}'.format(len(str(i + 1)), i + 1).encode('utf-8')],
+        'certStatus': [b'VALID'],
+        'subjectName': ['CN=host{0:07d}.{1},O={2}'.format(i, domain, domain.upper()).encode('utf-8')]
+    }
+
+
+def _rule(i, base_dn, container, rng):
+    unique_id = _unique_id(rng)
+    return 'ipaUniqueID={0},{1},{2}'.format(unique_id.decode('utf-8'), container, base_dn), {
+        'objectClass': [b'top', b'ipaassociation'],
+        'cn': ['rule{0:05d}'.format(i).encode('utf-8')],
+        'ipaUniqueID': [unique_id],
+        'entryUSN': [str(i + 1).encode('utf-8')],
+        'modifyTimestamp': [b'20240101000000Z']
+    }
+
+
+def _system(directory, hosts):
+    base_dn = directory.base_dn
+    suffix = base_dn.replace('=', '\\3D').replace(',', '\\2C')
+    directory.add('cn=config', {
+        'objectClass': [b'top', b'nsslapdConfig'],
+        'nsslapd-localhost': [directory.host.encode('utf-8')],
+        'nsslapd-defaultnamingcontext': [base_dn.encode('utf-8')],
+        'nsslapd-allow-anonymous-access': [b'rootdse']
+    })
+    directory.add('cn=mapping tree,cn=config', {'objectClass': [b'top', b'extensibleObject']})
+    directory.add('cn={0},cn=mapping tree,cn=config'.format(suffix), {'objectClass': [b'top', b'nsMappingTree']})
+    replica = 'cn=replica,cn={0},cn=mapping tree,cn=config'.format(suffix)
+    directory.add(replica, {'objectClass': [b'top', b'nsds5Replica']})
+    for other in hosts:
+        if other == directory.host:
+            continue
+        directory.add('cn=meTo{0},{1}'.format(other, replica), {
+            'objectClass': [b'top', b'nsds5replicationagreement'],
+            'nsDS5ReplicaHost': [other.encode('utf-8')],
+            'nsds5replicaLastUpdateStatus': [b'Error (0) Replica acquired successfully: Incremental update succeeded']
+        })
+
+    ruv = [b'{replicageneration} 5f00000000000000000']
+    for i, host in enumerate(hosts):
+        ruv.append('{{replica {0} ldap://{1}:389}} 5f000000000000{0:02x}0000 5f100000000000{0:02x}0000'.format(
+            i + 3, host).encode('utf-8'))
+    directory.add('nsuniqueid=ffffffff-ffffffff-ffffffff-ffffffff,{0}'.format(base_dn), {
+        'objectClass': [b'top', b'nsTombstone', b'extensibleobject'],
+        'nsUniqueId': [b'ffffffff-ffffffff-ffffffff-ffffffff'],
+        'nsds50ruv': ruv,
+        'nscpentrywsi': [b'nsds50ruv: ' + value for value in ruv]
+    })
+
+
+def generate(replicas=3, users=1000, hosts=None, certs=None, groups=None, rules=None, missing=0.001,
+             duplicates=0.0005, conflicts=0, seed=0, domain=DOMAIN):
+    rng = random.Random(seed)
+    hosts = users // 2 if hosts is None else hosts
+    certs = hosts if certs is None else certs
+    groups = max(1, users // 50) if groups is None else groups
+    rules = max(1, users // 100) if rules is None else rules
+
+    names = _hosts(replicas, domain)
+    directories = [Directory(host, domain) for host in names]
+    truth = Inconsistencies()
+    base_dn = directories[0].base_dn
+
+    for directory in directories:
+        directory.add(base_dn, {'objectClass': [b'top', b'domain']})
+        directory.add('o=ipaca', {'objectClass': [b'top', b'organization']})
+        for dn in _containers(base_dn):
+            directory.add(dn, {'objectClass': [b'top', b'nsContainer']})
+        _system(directory, names)
+
+    def populate(check, count, build):
+        truth.missing[check] = set()
+        for i in range(count):
+            dn, attrs = build(i)
+            for directory in directories:
+                directory.add(dn, attrs)
+            if replicas > 1 and rng.random() < missing:
+                directories[rng.randrange(replicas)].remove(dn)
+                truth.missing[check].add(dn.lower())
+
+    populate('users', users, lambda i: _user(i, base_dn, rng))
+    populate('hosts', hosts, lambda i: _host(i, base_dn, domain, rng))
+    populate('certs', certs, lambda i: _cert(i, domain))
+    populate('ugroups', groups, lambda i: (
+        'cn=group{0:05d},cn=groups,cn=accounts,{1}'.format(i, base_dn), {
+            'objectClass': [b'top', b'ipausergroup', b'ipaobject'],
+            'cn': ['group{0:05d}'.format(i).encode('utf-8')],
+            'ipaUniqueID': [_unique_id(rng)]
+        }))
+    populate('hbac', rules, lambda i: _rule(i, base_dn, 'cn=hbac', rng))
+    populate('sudo', rules, lambda i: _rule(i, base_dn, 'cn=sudorules,cn=sudo', rng))
+
+    # An entry that was added on two replicas at once: same DN, a different
+    # ipaUniqueID on each side until replication resolves it.
+    for check, count in [('users', users), ('hosts', hosts)]:
+        truth.duplicates[check] = set()
+        if replicas < 2:
+            continue
+        build = {
+            'users': lambda i: _user(i, base_dn, rng),
+            'hosts': lambda i: _host(i, base_dn, domain, rng)
+        }[check]
+        for i in range(int(count * duplicates)):
+            index = rng.randrange(count)
+            dn, attrs = build(index)
+            directory = directories[rng.randrange(replicas)]
+            if dn.lower() not in directory.entries:
+                continue
+            existing = directory.entries[dn.lower()][1]
+            attrs = dict(existing)
+            attrs['ipaUniqueID'] = [_unique_id(rng)]
+            directory.add(dn, attrs)
+            truth.duplicates[check].add(dn.lower())
+
+    for i in range(conflicts):
+        directory = directories[rng.randrange(replicas)]
+        dn, attrs = _user(users + i, base_dn, rng)
+        dn = 'nsuniqueid={0}+{1}'.format(_unique_id(rng).decode('utf-8'), dn)
+        attrs['nsds5ReplConflict'] = ['namingConflict {0}'.format(dn).encode('utf-8')]
+        directory.add(dn, attrs)
+        truth.conflicts[directory.host] = truth.conflicts.get(directory.host, 0) + 1
+
+    for directory in directories:
+        for parent, children in directory.children.items():
+            if parent in directory.entries:
+                dn, attrs = directory.entries[parent]
+                attrs['numSubordinates'] = [str(len(children)).encode('utf-8')]
+
+    return directories, truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic IPA directory and print its shape')
+    parser.add_argument('--replicas', type=int, default=3)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--hosts', type=int, default=None)
+    parser.add_argument('--certs', type=int, default=None)
+    parser.add_argument('--missing', type=float, default=0.001)
+    parser.add_argument('--duplicates', type=float, default=0.0005)
+    parser.add_argument('--conflicts', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    directories, truth = generate(
+        replicas=args.replicas, users=args.users, hosts=args.hosts, certs=args.certs,
+        missing=args.missing, duplicates=args.duplicates, conflicts=args.conflicts, seed=args.seed
+    )
+    for directory in directories:
+        print('{0}: {1} entries'.format(directory.host, len(directory)))
+    print(truth.as_dict())
+
+
+if __name__ == '__main__':
+    main()
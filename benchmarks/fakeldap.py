@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+In-process LDAP stand-in for benchmarks
+
+FakeConnection answers the subset of the python-ldap connection API that
+checkipaconsistency uses (synchronous and asynchronous searches, the paged
+results, server side sort and virtual list view controls, binds and whoami)
+from a benchmarks.directory.Directory.  install() points ldap.initialize at
+a set of directories so FreeIPAServer can be used unchanged.  python-ldap
+itself is still required for its constants, exceptions and controls.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import ldap
+from ldap.controls import SimplePagedResultsControl
+from ldap.controls.sss import SSSRequestControl
+from ldap.controls.vlv import VLVRequestControl, VLVResponseControl
+
+OPERATIONAL = frozenset(['numsubordinates', 'entryusn', 'modifytimestamp', 'nscpentrywsi', 'nsds50ruv'])
+
+
+def _split(inner):
+    parts = list()
+    depth = 0
+    start = None
+    for i, char in enumerate(inner):
+        if char == '(':
+            if depth == 0:
+                start = i
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                parts.append(inner[start:i + 1])
+    return parts
+
+
+def _values(attrs, name):
+    for attr, values in attrs.items():
+        if attr.lower() == name:
+            return [value.decode('utf-8').lower() for value in values]
+    return list()
+
+
+def compile_filter(fltr):
+    inner = fltr.strip()[1:-1]
+
+    if inner[0] in '&|!':
+        children = [compile_filter(part) for part in _split(inner[1:])]
+        if inner[0] == '&':
+            return lambda attrs: all(child(attrs) for child in children)
+        if inner[0] == '|':
+            return lambda attrs: any(child(attrs) for child in children)
+        return lambda attrs: not children[0](attrs)
+
+    for op in ['>=', '<=']:
+        if op in inner:
+            name, value = inner.split(op, 1)
+            name = name.lower()
+            value = value.lower()
+
+            def compare(attrs, name=name, value=value, op=op):
+                for current in _values(attrs, name):
+                    if current.isdigit() and value.isdigit():
+                        current, other = int(current), int(value)
+                    else:
+                        other = value
+                    if (current >= other) if op == '>=' else (current <= other):
+                        return True
+                return False
+            return compare
+
+    name, value = inner.split('=', 1)
+    name = name.lower()
+    value = value.lower()
+
+    if value == '*':
+        if name == 'objectclass':
+            return lambda attrs: True
+        return lambda attrs: bool(_values(attrs, name))
+
+    if '*' in value:
+        pieces = value.split('*')
+
+        def substring(attrs):
+            for current in _values(attrs, name):
+                if not current.startswith(pieces[0]) or not current.endswith(pieces[-1]):
+                    continue
+                position = len(pieces[0])
+                for piece in pieces[1:-1]:
+                    position = current.find(piece, position)
+                    if position < 0:
+                        break
+                    position += len(piece)
+                else:
+                    return True
+            return False
+        return substring
+
+    return lambda attrs: value in _values(attrs, name)
+
+
+class FakeConnection(object):
+    def __init__(self, directory, latency=0.0, network=None):
+        self._directory = directory
+        self._network = network
+        self._latency = latency
+        self._msgid = 0
+        self._pending = dict()
+        self._filters = dict()
+        self.searches = 0
+
+    def set_option(self, option, value):
+        pass
+
+    def simple_bind_s(self, who=None, cred=None):
+        self._wait()
+
+    def whoami_s(self):
+        self._wait()
+        return 'dn: cn=Directory Manager'
+
+    def unbind_s(self):
+        if self._network is not None:
+            self._network.closed(self)
+
+    def abandon(self, msgid):
+        self._pending.pop(msgid, None)
+
+    def _wait(self):
+        if self._directory.down:
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+        if self._latency:
+            time.sleep(self._latency)
+
+    def _scope(self, base, scope):
+        entries = self._directory.entries
+        children = self._directory.children
+        if scope == ldap.SCOPE_BASE:
+            yield base
+            return
+        if scope == ldap.SCOPE_ONELEVEL:
+            for key in children.get(base, ()):
+                yield key
+            return
+        stack = [base]
+        while stack:
+            key = stack.pop()
+            if key in entries:
+                yield key
+            stack.extend(reversed(list(children.get(key, ()))))
+
+    @staticmethod
+    def _select(attrs, attrlist):
+        if attrlist == ['1.1']:
+            return dict()
+        if not attrlist or '*' in attrlist:
+            selected = dict((attr, values) for attr, values in attrs.items() if attr.lower() not in OPERATIONAL)
+            if not attrlist:
+                return selected
+        else:
+            selected = dict()
+        wanted = set(attr.lower() for attr in attrlist)
+        for attr, values in attrs.items():
+            if attr.lower() in wanted:
+                selected[attr] = values
+        return selected
+
+    def _search(self, base, scope, filterstr, attrlist):
+        self.searches += 1
+        self._wait()
+        base = base.lower()
+        if base not in self._directory.entries:
+            raise ldap.NO_SUCH_OBJECT({'desc': 'No such object', 'matched': ''})
+
+        if filterstr not in self._filters:
+            self._filters[filterstr] = compile_filter(filterstr)
+        match = self._filters[filterstr]
+
+        results = list()
+        for key in self._scope(base, scope):
+            dn, attrs = self._directory.entries[key]
+            if match(attrs):
+                results.append((dn, self._select(attrs, attrlist)))
+        return results
+
+    def _sort(self, results, rule):
+        name = rule.lstrip('-').split(':')[0].lower()
+
+        def key(result):
+            values = _values(self._directory.entries[result[0].lower()][1], name)
+            return values[0] if values else ''
+        return sorted(results, key=key, reverse=rule.startswith('-'))
+
+    def search_s(self, base, scope, filterstr='(objectClass=*)', attrlist=None, attrsonly=0):
+        return self._search(base, scope, filterstr, attrlist)
+
+    def search_ext(self, base, scope, filterstr='(objectClass=*)', attrlist=None, attrsonly=0, serverctrls=None,
+                   clientctrls=None, timeout=-1, sizelimit=0):
+        self._msgid += 1
+        try:
+            results = self._search(base, scope, filterstr, attrlist)
+        except ldap.NO_SUCH_OBJECT as e:
+            # Like python-ldap, the error comes back with the result.
+            e.args[0]['msgid'] = self._msgid
+            self._pending[self._msgid] = e
+            return self._msgid
+        controls = list()
+        for control in serverctrls or []:
+            if control.controlType == SSSRequestControl.controlType:
+                results = self._sort(results, control.ordering_rules[0])
+        for control in serverctrls or []:
+            if control.controlType == VLVRequestControl.controlType:
+                response = VLVResponseControl()
+                response.contentCount = len(results)
+                response.targetPosition = control.offset
+                response.virtualListViewResult = 0
+                controls.append(response)
+                start = max(0, control.offset - 1 - control.before_count)
+                results = results[start:control.offset + control.after_count]
+            elif control.controlType == SimplePagedResultsControl.controlType:
+                start = int(control.cookie or 0)
+                end = start + control.size
+                cookie = str(end).encode('utf-8') if end < len(results) else b''
+                controls.append(SimplePagedResultsControl(False, size=control.size, cookie=cookie))
+                results = results[start:end]
+        self._pending[self._msgid] = (results, controls)
+        return self._msgid
+
+    def result3(self, msgid=ldap.RES_ANY, all=1, timeout=None):
+        if msgid == ldap.RES_ANY:
+            msgid = min(self._pending)
+        if isinstance(self._pending[msgid], ldap.LDAPError):
+            raise self._pending.pop(msgid)
+        results, controls = self._pending.pop(msgid)
+        return ldap.RES_SEARCH_RESULT, results, msgid, controls
+
+
+class FakeNetwork(object):
+    def __init__(self, directories, latency=0.0):
+        self.directories = dict((directory.host, directory) for directory in directories)
+        self.latency = latency
+        self.connections = list()
+        self.open = 0
+        self.peak_open = 0
+        self._lock = threading.Lock()
+
+    def initialize(self, url):
+        host = url.split('://', 1)[-1].split(':', 1)[0].rstrip('/')
+        if host not in self.directories:
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+        conn = FakeConnection(self.directories[host], self.latency, self)
+        with self._lock:
+            self.connections.append(conn)
+            self.open += 1
+            self.peak_open = max(self.peak_open, self.open)
+        return conn
+
+    def closed(self, conn):
+        with self._lock:
+            self.open -= 1
+
+    @property
+    def searches(self):
+        return sum(conn.searches for conn in self.connections)
+
+
+@contextmanager
+def install(directories, latency=0.0):
+    network = FakeNetwork(directories, latency)
+    initialize = ldap.initialize
+    ldap.initialize = network.initialize
+    try:
+        yield network
+    finally:
+        ldap.initialize = initialize
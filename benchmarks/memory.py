@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Peak memory benchmark for cached check results
+
+Compares the peak RSS of keeping raw python-ldap result tuples for every
+server against keeping compact, interned Entry records.
+
+Usage: python benchmarks/memory.py [--servers N] [--users N]
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from checkipaconsistency.entry import Entry  # noqa: E402
+
+BASE_DN = 'dc=ipa,dc=example,dc=com'
+
+
+def raw_results(users):
+    results = list()
+    for i in range(users):
+        dn = 'uid=user{0:07d},cn=users,cn=accounts,{1}'.format(i, BASE_DN)
+        attrs = {
+            'ipaUniqueID': ['{0:08x}-0000-0000-0000-{0:012x}'.format(i).encode('utf-8')],
+            'cn': ['User {0}'.format(i).encode('utf-8')]
+        }
+        results.append((dn, attrs))
+    return results
+
+
+def peak_rss():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss //= 1024
+    return rss
+
+
+def run(mode, servers, users):
+    baseline = peak_rss()
+    cache = list()
+    for _ in range(servers):
+        results = raw_results(users)
+        if mode == 'compact':
+            results = [Entry.from_ldap(item) for item in results]
+        cache.append(results)
+    print(peak_rss() - baseline)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak memory of raw vs compact check results')
+    parser.add_argument('--servers', type=int, default=8)
+    parser.add_argument('--users', type=int, default=150000)
+    parser.add_argument('--mode', choices=['raw', 'compact'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args.servers, args.users)
+        return
+
+    print('{0} servers x {1} users'.format(args.servers, args.users))
+    results = dict()
+    for mode in ['raw', 'compact']:
+        output = subprocess.check_output([
+            sys.executable, __file__,
+            '--mode', mode,
+            '--servers', str(args.servers),
+            '--users', str(args.users)
+        ])
+        results[mode] = int(output.decode('utf-8').strip())
+        print('{0:8} peak RSS growth: {1:8d} KiB'.format(mode, results[mode]))
+
+    if results['compact']:
+        print('ratio: {0:.1f}x'.format(float(results['raw']) / results['compact']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Startup time budget for the Nagios plugin path
+
+Runs a single-check Nagios invocation (cipa -n CHECK) in a fresh
+interpreter under python -X importtime, against small synthetic
+directories served by the in-process LDAP stand-in, and reports the total
+import time, the slowest top level imports and the wall time of the run.
+Exits non-zero when the import time exceeds the budget or when a module
+that only output back-ends, DNS or large comparisons need was imported.
+
+Usage: python benchmarks/startup.py [--check CHECK] [--budget MS] [--repeat N]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+BENCHMARKS = os.path.dirname(os.path.realpath(__file__))
+
+# Modules the Nagios path must not import.
+LAZY = ['prettytable', 'yaml', 'dns', 'numpy', 'http.server', 'sqlite3', 'configparser']
+
+SCRIPT = '''
+import sys
+sys.path.insert(0, {benchmarks!r})
+sys.path.insert(0, {root!r})
+from checkipaconsistency.main import Main
+from directory import DOMAIN, generate
+from fakeldap import install
+
+directories, _ = generate(replicas=2, users=100)
+argv = ['-d', DOMAIN, '-D', 'cn=Directory Manager', '-W', 'benchmark', '-n', {check!r},
+        '-H'] + [d.host for d in directories]
+
+with install(directories):
+    try:
+        Main(argv).run()
+    except SystemExit:
+        pass
+
+sys.stderr.write('modules: {{0}}\\n'.format(' '.join(sorted(sys.modules))))
+'''
+
+
+def parse(stderr):
+    imports = list()
+    modules = set()
+    for line in stderr.splitlines():
+        if line.startswith('modules: '):
+            modules = set(line.split()[1:])
+            continue
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Top level imports are the ones not nested under another import.
+        if name.startswith(' ') and not name.startswith('  '):
+            imports.append((int(cumulative), name.strip()))
+    return imports, modules
+
+
+def run(check):
+    script = SCRIPT.format(benchmarks=BENCHMARKS, root=os.path.join(BENCHMARKS, '..'), check=check)
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'cipa.py')
+    with open(path, 'w') as f:
+        f.write(script)
+    env = dict(os.environ)
+    env['XDG_CONFIG_HOME'] = directory
+    start = timeit.default_timer()
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', path], env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    _, stderr = process.communicate()
+    wall = timeit.default_timer() - start
+    shutil.rmtree(directory)
+    return wall, stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import time of a single-check Nagios run')
+    parser.add_argument('--check', default='users', help='check to run (default: users)')
+    parser.add_argument('--budget', type=float, default=150.0, help='import time budget in ms (default: 150)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='number of slowest imports to list (default: 10)')
+    args = parser.parse_args()
+
+    # The benchmark harness itself imports the generator and the LDAP stand-in.
+    harness = set(['directory', 'fakeldap'])
+
+    best = None
+    for _ in range(args.repeat):
+        wall, stderr = run(args.check)
+        imports, modules = parse(stderr)
+        if not modules:
+            print(stderr)
+            sys.exit(1)
+        imports = [(cumulative, name) for cumulative, name in imports if name not in harness]
+        total = sum(cumulative for cumulative, _ in imports) / 1000.0
+        if best is None or total < best[0]:
+            best = (total, wall, imports, modules)
+
+    total, wall, imports, modules = best
+    print('{0:>10} {1}'.format('ms', 'module'))
+    for cumulative, name in sorted(imports, reverse=True)[:args.top]:
+        print('{0:>10.1f} {1}'.format(cumulative / 1000.0, name))
+    print('')
+    print('import time: {0:.1f} ms (budget {1:.1f} ms)'.format(total, args.budget))
+    print('wall time: {0:.1f} ms'.format(wall * 1000))
+
+    failed = False
+    loaded = [module for module in LAZY if module in modules]
+    if loaded:
+        print('imported on the Nagios path: {0}'.format(', '.join(loaded)))
+        failed = True
+    if total > args.budget:
+        print('import time over budget')
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
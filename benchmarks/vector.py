@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Set-based vs NumPy missing DN comparison
+
+Times checkipaconsistency.vector.set_missing against vector_missing on
+compact Entry lists for every combination of entry count and replica
+count, and checks that both return the same missing DNs.
+
+Usage: python benchmarks/vector.py [--sizes N ...] [--replicas N ...]
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from checkipaconsistency.entry import Entry  # noqa: E402
+from checkipaconsistency.vector import load_numpy, set_missing, vector_missing  # noqa: E402
+
+BASE_DN = 'dc=ipa,dc=example,dc=com'
+
+
+def servers(size, replicas, missing, seed):
+    rng = random.Random(seed)
+    entries = [Entry('cn={0},ou=certificateRepository,ou=ca,o=ipaca'.format(i + 1)) for i in range(size)]
+    result = dict()
+    for replica in range(replicas):
+        result['ipa{0:02d}'.format(replica + 1)] = [entry for entry in entries if rng.random() >= missing]
+    return result
+
+
+def best(fn, data, repeat):
+    return min(timeit.repeat(lambda: fn(data), number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare set-based and NumPy missing DN detection')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--replicas', type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument('--missing', type=float, default=0.001)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if load_numpy() is None:
+        print('numpy is not installed')
+        sys.exit(1)
+
+    print('{0:>8} {1:>8} {2:>10} {3:>10} {4:>8}'.format('entries', 'replicas', 'set', 'numpy', 'speedup'))
+    for size in args.sizes:
+        for replicas in args.replicas:
+            data = servers(size, replicas, args.missing, args.seed)
+            expected = dict((server, sorted(dns)) for server, dns in set_missing(data).items())
+            actual = dict((server, sorted(dns)) for server, dns in vector_missing(data).items())
+            if expected != actual:
+                print('{0:>8} {1:>8} results differ'.format(size, replicas))
+                sys.exit(1)
+
+            sets = best(set_missing, data, args.repeat)
+            vectors = best(vector_missing, data, args.repeat)
+            print('{0:>8} {1:>8} {2:>9.3f}s {3:>9.3f}s {4:>7.1f}x'.format(
+                size, replicas, sets, vectors, sets / vectors))
+
+
+if __name__ == '__main__':
+    main()
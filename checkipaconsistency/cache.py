@@ -0,0 +1,99 @@
+#  -*- coding: utf-8 -*-
+"""
+Result cache module
+
+This file is part of checkipaconsistency.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+import time
+
+MISSING = object()
+
+
+class CacheEntry(object):
+    __slots__ = ('value', 'error', 'expires')
+
+    def __init__(self, value, error, expires):
+        self.value = value
+        self.error = error
+        self.expires = expires
+
+
+class ResultCache(object):
+    def __init__(self, ttl=None, error_ttl=None):
+        self._ttl = ttl
+        self._error_ttl = error_ttl
+        self._ttls = dict()
+        self._entries = dict()
+        self._lock = threading.Lock()
+
+        self.hits = dict()
+        self.misses = dict()
+
+    def set_ttl(self, name, ttl):
+        self._ttls[name] = ttl
+
+    def _expires(self, name, error):
+        ttl = self._ttls.get(name, self._ttl)
+        if error and self._error_ttl is not None:
+            ttl = self._error_ttl if ttl is None else min(ttl, self._error_ttl)
+        if ttl is None:
+            return None
+        return time.time() + ttl
+
+    def _lookup(self, name):
+        entry = self._entries.get(name, MISSING)
+        if entry is MISSING:
+            return MISSING
+        if entry.expires is not None and entry.expires <= time.time():
+            del self._entries[name]
+            return MISSING
+        return entry
+
+    def get(self, name, compute):
+        with self._lock:
+            entry = self._lookup(name)
+            if entry is not MISSING:
+                self.hits[name] = self.hits.get(name, 0) + 1
+                return entry.value
+            self.misses[name] = self.misses.get(name, 0) + 1
+
+        value, error = compute()
+        self.set(name, value, error)
+        return value
+
+    def set(self, name, value, error=False):
+        with self._lock:
+            self._entries[name] = CacheEntry(value, error, self._expires(name, error))
+
+    def invalidate(self, names=None):
+        with self._lock:
+            if names is None:
+                self._entries = dict()
+                return
+            for name in names:
+                self._entries.pop(name, None)
+
+    def stats(self):
+        with self._lock:
+            r = dict()
+            for name in set(self.hits) | set(self.misses):
+                r[name] = {
+                    'hits': self.hits.get(name, 0),
+                    'misses': self.misses.get(name, 0)
+                }
+            return r
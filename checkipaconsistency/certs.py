@@ -0,0 +1,96 @@
+#  -*- coding: utf-8 -*-
+"""
+Certificate repository comparison module
+
+This file is part of checkipaconsistency.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from .vector import set_missing
+
+ENUMERATE_LIMIT = 5000
+
+
+def encode_serial(serial):
+    # Dogtag stores serial numbers as decimal strings with a two digit length
+    # prefix, which makes their lexical order match the numeric one.
+    digits = str(serial)
+    return '{0:02d}{1}'.format(len(digits), digits)
+
+
+def decode_serial(value):
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    return int(value[2:])
+
+
+def range_filter(low=None, high=None):
+    fltr = '(certStatus=*)'
+    if low:
+        fltr += '(serialno>={0})'.format(encode_serial(low))
+    if high is not None:
+        fltr += '(!(serialno>={0}))'.format(encode_serial(high))
+    return '(&{0})'.format(fltr)
+
+
+def split(low, high, chunks):
+    step = max(1, -(-(high - low) // chunks))
+    return [(start, min(start + step, high)) for start in range(low, high, step)]
+
+
+def compare(servers, gather, chunks=16, limit=ENUMERATE_LIMIT):
+    summary = gather(servers, lambda payload: payload.cert_summary())
+    if any(value is False for value in summary.values()):
+        return False
+
+    missing_dn = dict((server, list()) for server in servers)
+    result = {
+        'summary': summary,
+        'missing_dn': missing_dn,
+        'ranges': 0,
+        'enumerated': 0
+    }
+
+    if _same(summary.values()):
+        return result
+
+    highest = max(value['highest'] or 0 for value in summary.values())
+    pending = [(0, highest + 1)]
+    while pending:
+        low, high = pending.pop()
+        result['ranges'] += 1
+        ranges = gather(servers, lambda payload: payload.cert_summary(low, high))
+        if any(value is False for value in ranges.values()):
+            return False
+        if _same(ranges.values()):
+            continue
+
+        if max(value['count'] for value in ranges.values()) > limit and high - low > chunks:
+            pending.extend(split(low, high, chunks))
+            continue
+
+        entries = gather(servers, lambda payload: payload.cert_range(low, high))
+        if any(value is False for value in entries.values()):
+            return False
+        result['enumerated'] += 1
+        for server, delta in set_missing(entries).items():
+            missing_dn[server].extend(delta)
+
+    return result
+
+
+def _same(values):
+    values = [(value['count'], value['highest'], value.get('revoked')) for value in values]
+    return values.count(values[0]) == len(values)
@@ -0,0 +1,71 @@
+#  -*- coding: utf-8 -*-
+"""
+Digest tree module
+
+This file is part of checkipaconsistency.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+
+from .entry import normalise
+
+
+class DigestTree(object):
+    def __init__(self, prefix=3):
+        self.prefix = prefix
+        self.count = 0
+        self.buckets = dict()
+
+    @staticmethod
+    def bucket(dn, prefix=3):
+        return hashlib.sha1(normalise(dn).encode('utf-8')).hexdigest()[:prefix]
+
+    def add(self, dn, attrs):
+        values = [normalise(dn)]
+        for name in ['ipauniqueid', 'modifytimestamp']:
+            value = ''
+            for attr, attr_values in attrs.items():
+                if attr.lower() == name:
+                    value = normalise(attr_values[0])
+            values.append(value)
+
+        digest = int(hashlib.sha1('\0'.join(values).encode('utf-8')).hexdigest(), 16)
+        bucket = self.bucket(dn, self.prefix)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) ^ digest
+        self.count += 1
+
+    @property
+    def root(self):
+        root = hashlib.sha1()
+        for bucket in sorted(self.buckets):
+            root.update('{0}:{1:x};'.format(bucket, self.buckets[bucket]).encode('utf-8'))
+        return root.hexdigest()
+
+
+def diverging_buckets(trees):
+    roots = set(tree.root for tree in trees)
+    if len(roots) == 1:
+        return set()
+
+    r = set()
+    buckets = set()
+    for tree in trees:
+        buckets.update(tree.buckets)
+    for bucket in buckets:
+        values = set(tree.buckets.get(bucket) for tree in trees)
+        if len(values) > 1:
+            r.add(bucket)
+    return r
@@ -0,0 +1,100 @@
+#  -*- coding: utf-8 -*-
+"""
+Duplicate detection module
+
+This file is part of checkipaconsistency.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+class DuplicateIndex(object):
+    # Almost every identifier maps to a single ipaUniqueID and DN on every
+    # server, so it is kept as one (unique_id, dn, server bitmask) tuple.
+    # Only identifiers that deviate from their first record are expanded
+    # into per-server and per-DN sets.
+    def __init__(self, servers, by_cn=False):
+        self._servers = list(servers)
+        self._bits = dict((server, 1 << i) for i, server in enumerate(self._servers))
+        self._by_cn = by_cn
+        self._seen = dict()
+        self._detail = dict()
+
+    def add(self, server, entries):
+        bit = self._bits[server]
+        seen = self._seen
+        by_cn = self._by_cn
+
+        for entry in entries:
+            dn = entry.dn
+            identifier = entry.cn if by_cn else dn
+            unique_id = entry.unique_id
+            record = seen.get(identifier)
+            if record is not None and record[0] == unique_id and record[1] == dn:
+                if not record[2] & bit:
+                    seen[identifier] = (unique_id, dn, record[2] | bit)
+                continue
+            self._add(identifier, unique_id, dn, bit)
+
+    def update(self, other):
+        for identifier, (unique_id, dn, mask) in other._seen.items():
+            self._add(identifier, unique_id, dn, mask)
+        for identifier, detail in other._detail.items():
+            for server, values in detail['servers'].items():
+                for unique_id in values:
+                    self._expand(identifier)['servers'].setdefault(server, set()).add(unique_id)
+            for dn, values in detail['dn'].items():
+                for unique_id in values:
+                    self._add_detail(self._expand(identifier), unique_id, dn, 0)
+
+    def _add(self, identifier, unique_id, dn, mask):
+        record = self._seen.get(identifier)
+        if record is None and identifier not in self._detail:
+            self._seen[identifier] = (unique_id, dn, mask)
+            return
+        if record is not None and record[0] == unique_id and record[1] == dn:
+            self._seen[identifier] = (unique_id, dn, record[2] | mask)
+            return
+        self._add_detail(self._expand(identifier), unique_id, dn, mask)
+
+    def _expand(self, identifier):
+        detail = self._detail.get(identifier)
+        if detail is not None:
+            return detail
+
+        detail = {
+            'identifiers': set(),
+            'servers': dict(),
+            'dn': dict()
+        }
+        self._detail[identifier] = detail
+        record = self._seen.pop(identifier, None)
+        if record is not None:
+            self._add_detail(detail, *record)
+        return detail
+
+    def _add_detail(self, detail, unique_id, dn, mask):
+        detail['identifiers'].add(unique_id)
+        detail['dn'].setdefault(dn, set()).add(unique_id)
+        for server in self._servers:
+            if mask & self._bits[server]:
+                detail['servers'].setdefault(server, set()).add(unique_id)
+
+    def collisions(self):
+        for identifier, detail in self._detail.items():
+            if len(detail['identifiers']) > 1:
+                yield identifier, detail
+
+    def __len__(self):
+        return len(self._seen) + len(self._detail)
@@ -0,0 +1,61 @@
+#  -*- coding: utf-8 -*-
+"""
+Compact entry module
+
+This file is part of checkipaconsistency.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+
+try:
+    intern = sys.intern
+except AttributeError:
+    # Python 2 can only intern byte strings, and DNs are normalised to text.
+    def intern(value):
+        return value
+
+
+def normalise(value):
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    return intern(value.lower())
+
+
+class Entry(object):
+    __slots__ = ('dn', 'cn', 'unique_id')
+
+    def __init__(self, dn, cn=None, unique_id=None):
+        self.dn = normalise(dn)
+        self.cn = normalise(cn)
+        self.unique_id = normalise(unique_id)
+
+    def __repr__(self):
+        return 'Entry({0!r}, {1!r}, {2!r})'.format(self.dn, self.cn, self.unique_id)
+
+    @classmethod
+    def from_ldap(cls, item):
+        dn, attrs = item
+        cn = None
+        unique_id = None
+        for attr, values in attrs.items():
+            attr = attr.lower()
+            if attr == 'cn':
+                cn = values[0]
+            elif attr == 'ipauniqueid':
+                unique_id = values[0]
+        return cls(dn, cn, unique_id)
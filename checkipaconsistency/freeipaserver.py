@@ -23,159 +23,171 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 from __future__ import print_function
+import calendar
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import ldap
-import dns.resolver
+from ldap.controls import SimplePagedResultsControl
+from ldap.controls.sss import SSSRequestControl
+from ldap.controls.vlv import VLVRequestControl, VLVResponseControl
+from .entry import Entry, normalise
+from .digest import DigestTree
+from .pool import DOWN, ConnectionPool
+from .cache import ResultCache
+from .certs import decode_serial, range_filter
+from .ruv import parse_ruv
+from .shards import ATTRIBUTES, merge, prefix_filters, serial_filters
+from .resolver import ResolveError, Resolver
 
 
 class FreeIPAServer(object):
-    def __init__(self, host, domain, binddn, bindpw):
-
-        self._users = None
-        self._susers = None
-        self._pusers = None
-        self._hosts = None
-        self._services = None
-        self._ugroups = None
-        self._hgroups = None
-        self._ngroups = None
-        self._hbac = None
-        self._sudo = None
-        self._zones = None
-        self._certs = None
-        self._conflicts = None
-        self._ghosts = None
-        self._bind = None
-        self._msdcs = None
-        self._replicas = None
-        self._healthy_agreements = False
-
+    def __init__(self, host, domain, binddn, bindpw, attrs=None, page_size=0, pool_size=1, keepalive=60,
+                 cache_ttl=None, error_ttl=None, resolver=None, shards=0, limiter=None):
+
+        self.cache = ResultCache(ttl=cache_ttl, error_ttl=error_ttl)
+        self._errors = 0
+        self._prefetched = dict()
+        self._query_checks = dict()
+        self._record_lock = threading.Lock()
+        self.transfer = dict()
+        self.profile = dict()
+
+        self._resolver = resolver or Resolver()
+        self._attrs = attrs or dict()
+        self._page_size = page_size
+        self._pool_size = pool_size
+        self._shards = shards
+        self._limiter = limiter
+        self._keepalive = keepalive
         self._binddn = binddn
         self._bindpw = bindpw
         self._domain = domain
         self._url = 'ldaps://' + host
         self.hostname_short = host.replace('.{0}'.format(domain), '')
-        self._conn = self._get_conn()
+        self._pool = self._get_pool()
 
-        if not self._conn:
+        if not self._pool:
             return
 
         self._fqdn = self._get_fqdn()
         self.hostname_short = self._fqdn.replace('.{0}'.format(domain), '')
 
-
         self._base_dn = 'dc=' + self._domain.replace('.', ',dc=')
 
         context = self._get_context()
         if self._base_dn != context:
             exit(1)
 
+        self._queries = self._get_queries()
+        for check, query in self._queries.items():
+            if check in self._attrs:
+                query['attrs'] = self._attrs[check]
+            self._query_checks[self._query_key(**query)] = check
+
     @property
     def users(self):
-        if not self._users:
-            self._users = self._get_users(user_base='active')
-        return self._users
+        return self._cached('users', lambda: self._get_users(user_base='active'))
 
     @property
     def susers(self):
-        if not self._susers:
-            self._susers = self._get_users(user_base='stage')
-        return self._susers
+        return self._cached('susers', lambda: self._get_users(user_base='stage'))
 
     @property
     def pusers(self):
-        if not self._pusers:
-            self._pusers = self._get_users(user_base='preserved')
-        return self._pusers
+        return self._cached('pusers', lambda: self._get_users(user_base='preserved'))
 
     @property
     def hosts(self):
-        if not self._hosts:
-            self._hosts = self._get_hosts()
-        return self._hosts
+        return self._cached('hosts', lambda: self._get_hosts())
 
     @property
     def services(self):
-        if not self._services:
-            self._services = self._get_services()
-        return self._services
+        return self._cached('services', lambda: self._get_services())
 
     @property
     def ugroups(self):
-        if not self._ugroups:
-            self._ugroups = self._get_groups()
-        return self._ugroups
+        return self._cached('ugroups', lambda: self._get_groups())
 
     @property
     def hgroups(self):
-        if not self._hgroups:
-            self._hgroups = self._get_hostgroups()
-        return self._hgroups
+        return self._cached('hgroups', lambda: self._get_hostgroups())
 
     @property
     def ngroups(self):
-        if not self._ngroups:
-            self._ngroups = self._count_netgroups()
-        return self._ngroups
+        return self._cached('ngroups', lambda: self._count_netgroups())
 
     @property
     def hbac(self):
-        if not self._hbac:
-            self._hbac = self._get_hbac_rules()
-        return self._hbac
+        return self._cached('hbac', lambda: self._get_hbac_rules())
 
     @property
     def sudo(self):
-        if not self._sudo:
-            self._sudo = self._get_sudo_rules()
-        return self._sudo
+        return self._cached('sudo', lambda: self._get_sudo_rules())
 
     @property
     def zones(self):
-        if not self._zones:
-            self._zones = self._get_dns_zones()
-        return self._zones
+        return self._cached('zones', lambda: self._get_dns_zones())
 
     @property
     def certs(self):
-        if not self._certs:
-            self._certs = self._get_certificates()
-        return self._certs
+        return self._cached('certs', lambda: self._get_certificates())
 
     @property
     def conflicts(self):
-        if not self._conflicts:
-            self._conflicts = self._get_ldap_conflicts()
-        return self._conflicts
+        return self._cached('conflicts', lambda: self._get_ldap_conflicts())
 
     @property
     def ghosts(self):
-        if not self._ghosts:
-            self._ghosts = self._get_ghost_replicas()
-        return self._ghosts
+        return self._cached('ghosts', lambda: self._get_ghost_replicas())
 
     @property
     def bind(self):
-        if not self._bind:
-            self._bind = self._get_anon_bind()
-        return self._bind
+        return self._cached('bind', lambda: self._get_anon_bind())
 
     @property
     def msdcs(self):
-        if not self._msdcs:
-            self._msdcs = self._get_ms_adtrust()
-        return self._msdcs
+        return self._cached('msdcs', lambda: self._get_ms_adtrust())
 
     @property
     def replicas(self):
-        if not self._replicas:
-            self._replicas, self._healthy_agreements = self._replication_agreements()
-        return self._replicas
+        return self._cached('replicas', self._replication_agreements)[0]
 
     @property
     def healthy_agreements(self):
-        if not self._healthy_agreements:
-            self._replicas, self._healthy_agreements = self._replication_agreements()
-        return self._healthy_agreements
+        return self._cached('replicas', self._replication_agreements)[1]
+
+    @property
+    def agreements(self):
+        return self._cached('replicas', self._replication_agreements)[2]
+
+    @property
+    def fqdn(self):
+        return self._fqdn
+
+    @property
+    def ruv(self):
+        return self._cached('ruv', self._get_ruv)
+
+    @property
+    def ca(self):
+        return self._cached('ca', self._has_ca)
+
+    def _cached(self, name, fn):
+        def compute():
+            errors = self._errors
+            value = fn()
+            return value, self._errors != errors
+
+        return self.cache.get(name, compute)
+
+    def invalidate(self, checks=None):
+        self.cache.invalidate(checks)
+        self._prefetched = dict()
+        with self._record_lock:
+            for check in list(self.transfer) if checks is None else checks:
+                self.transfer.pop(check, None)
+                self.profile.pop(check, None)
 
     @staticmethod
     def _get_ldap_msg(e):
@@ -188,30 +200,281 @@ class FreeIPAServer(object):
                 msg = e.args[0]['desc']
         return msg
 
-    def _get_conn(self):
-        ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
+    @staticmethod
+    def _get_ldap_msgid(e):
+        if e.args and isinstance(e.args[0], dict):
+            return e.args[0].get('msgid')
+        return None
+
+    def _get_pool(self):
+        pool = ConnectionPool(
+            self._url,
+            self._binddn,
+            self._bindpw,
+            size=self._pool_size,
+            idle=self._keepalive,
+            limiter=self._limiter
+        )
 
         try:
-            conn = ldap.initialize(self._url)
-            conn.set_option(ldap.OPT_NETWORK_TIMEOUT, 3)
-            conn.set_option(ldap.OPT_REFERRALS, ldap.OPT_OFF)
-            conn.simple_bind_s(self._binddn, self._bindpw)
+            pool.connect()
         except (
-            ldap.SERVER_DOWN,
             ldap.NO_SUCH_OBJECT,
             ldap.INVALID_CREDENTIALS
-        ):
+        ) + DOWN:
             return False
-        return conn
+        return pool
+
+    @property
+    def reconnects(self):
+        if not self._pool:
+            return 0
+        return self._pool.reconnects
+
+    def close(self):
+        if self._pool:
+            self._pool.close()
+
+    def _search(self, base, fltr, attrs=None, scope=ldap.SCOPE_SUBTREE, check=None):
+        key = self._query_key(base, fltr, attrs, scope)
+        if key in self._prefetched:
+            # Prefetched results are handed over once, so the raw entries do
+            # not stay around next to the compact cached ones.
+            results = self._prefetched.pop(key)
+            if results is False:
+                self._errors += 1
+            return results
+
+        if check is None:
+            check = self._query_checks.get(key)
+
+        def search():
+            if self._page_size and scope != ldap.SCOPE_BASE:
+                return self._search_paged(base, fltr, attrs, scope)
+            return self._pool.run(lambda conn: conn.search_s(base, scope, fltr, attrs))
+
+        try:
+            return list(self._measure(check, search))
+        except (ldap.NO_SUCH_OBJECT,) + DOWN:
+            self._errors += 1
+            return False
+        except ldap.REFERRAL:
+            exit(1)
+
+    def _search_paged(self, base, fltr, attrs=None, scope=ldap.SCOPE_SUBTREE):
+        control = SimplePagedResultsControl(True, size=self._page_size, cookie='')
+
+        with self._pool.connection() as conn:
+            while True:
+                msgid = conn.search_ext(base, scope, fltr, attrs, serverctrls=[control])
+                rtype, rdata, msgid, serverctrls = conn.result3(msgid)
+
+                for entry in rdata:
+                    yield entry
+
+                cookie = None
+                for ctrl in serverctrls:
+                    if ctrl.controlType == SimplePagedResultsControl.controlType:
+                        cookie = ctrl.cookie
+
+                if not cookie:
+                    break
+                control.cookie = cookie
+
+    def _search_check(self, check):
+        query = self._queries[check]
+        if self._shards > 1 and self._query_key(**query) not in self._prefetched:
+            results = self._search_sharded(check, query)
+            if results is not None:
+                return results
+        return self._search(**query)
+
+    def _search_sharded(self, check, query):
+        # Returns None whenever the shards cannot be shown to cover the
+        # unsharded search exactly once, in which case it is run as usual.
+        if check == 'certs':
+            expected, highest = self._vlv_count(query['base'], query['fltr'])
+            if expected is False:
+                return None
+            filters = serial_filters(highest or 0, self._shards)
+        elif check in ATTRIBUTES:
+            expected = self.count(check)
+            if expected is False:
+                return None
+            filters = prefix_filters(ATTRIBUTES[check], self._shards)
+        else:
+            return None
+
+        def search(fltr):
+            return self._search(
+                query['base'],
+                '(&{0}{1})'.format(query['fltr'], fltr),
+                query.get('attrs'),
+                scope=query.get('scope', ldap.SCOPE_SUBTREE),
+                check=check
+            )
+
+        with ThreadPoolExecutor(max_workers=min(len(filters), self._pool_size)) as executor:
+            shards = list(executor.map(search, filters))
+
+        if any(shard is False for shard in shards):
+            return False
+
+        results = merge(shards)
+        if results is None or len(results) != expected:
+            return None
+        return results
+
+    def _iter_search(self, base, fltr, attrs=None, scope=ldap.SCOPE_SUBTREE):
+        if self._page_size:
+            return self._search_paged(base, fltr, attrs, scope)
+        return iter(self._pool.run(lambda conn: conn.search_s(base, scope, fltr, attrs)))
+
+    def digest(self, check, prefix=3):
+        query = dict(self._queries[check])
+        query['attrs'] = ['ipaUniqueID', 'modifyTimestamp']
+        tree = DigestTree(prefix)
 
-    def _search(self, base, fltr, attrs=None, scope=ldap.SCOPE_SUBTREE):
         try:
-            return self._conn.search_s(base, scope, fltr, attrs)
-        except (ldap.NO_SUCH_OBJECT, ldap.SERVER_DOWN) as e:
+            for dn, attrs in self._measure(check, lambda: self._iter_search(**query)):
+                tree.add(dn, attrs)
+        except (ldap.NO_SUCH_OBJECT,) + DOWN:
             return False
         except ldap.REFERRAL:
             exit(1)
 
+        return tree
+
+    def sync(self, check, snapshot, reconcile=True):
+        query = dict(self._queries[check])
+        attrs = [attr for attr in query.get('attrs') or [] if attr != '1.1']
+        query['attrs'] = attrs + ['entryUSN', 'modifyTimestamp']
+
+        mark = snapshot.get('mark')
+        entries = dict()
+        if mark:
+            entries = snapshot.get('entries', dict())
+            if mark['attr'] == 'entryUSN':
+                since = '({0}>={1})'.format(mark['attr'], int(mark['value']) + 1)
+            else:
+                since = '({0}>={1})'.format(mark['attr'], mark['value'])
+            query['fltr'] = '(&{0}{1})'.format(query['fltr'], since)
+
+            tombstones = self._search(
+                query['base'],
+                '(&(objectClass=nsTombstone){0})'.format(since),
+                ['nscpEntryDN'],
+                scope=query.get('scope', ldap.SCOPE_SUBTREE),
+                check=check
+            )
+            for dn, attrs in tombstones or []:
+                for attr, values in attrs.items():
+                    if attr.lower() == 'nscpentrydn':
+                        entries.pop(normalise(values[0]), None)
+
+        results = self._search(check=check, **query)
+        if not results and type(results) is not list:
+            return False
+
+        usn = None
+        timestamp = None
+        for dn, attrs in results:
+            entry = Entry.from_ldap((dn, attrs))
+            entries[entry.dn] = [entry.cn, entry.unique_id]
+            for attr, values in attrs.items():
+                attr = attr.lower()
+                if attr == 'entryusn':
+                    usn = max(usn or 0, int(values[0]))
+                elif attr == 'modifytimestamp':
+                    timestamp = max(timestamp or '', values[0].decode('utf-8'))
+
+        if usn is not None:
+            mark = {'attr': 'entryUSN', 'value': usn}
+        elif timestamp is not None:
+            mark = {'attr': 'modifyTimestamp', 'value': timestamp}
+
+        # numSubordinates only matches the snapshot where the direct children of
+        # the base are exactly the check's entries; elsewhere deletions are only
+        # picked up from tombstones.
+        if reconcile and snapshot.get('mark'):
+            count = self.count(check)
+            if count is not False and count != len(entries):
+                return self.sync(check, dict(), reconcile)
+
+        self.cache.set(check, [Entry(dn, cn, unique_id) for dn, (cn, unique_id) in entries.items()])
+
+        return {
+            'mark': mark,
+            'entries': entries
+        }
+
+    def stream(self, check, callback):
+        query = self._queries[check]
+        count = 0
+
+        try:
+            for entry in self._measure(check, lambda: self._iter_search(**query)):
+                count += 1
+                callback(Entry.from_ldap(entry))
+        except (ldap.NO_SUCH_OBJECT,) + DOWN:
+            return False
+        except ldap.REFERRAL:
+            exit(1)
+
+        return count
+
+    def _measure(self, check, search):
+        start = time.time()
+        reconnects = self.reconnects
+        first = None
+        entries = 0
+        size = 0
+
+        try:
+            for entry in search():
+                if first is None:
+                    first = time.time() - start
+                entries += 1
+                size += self._entry_size(entry)
+                yield entry
+        finally:
+            self._record(check, time.time() - start, first, entries, size, self.reconnects - reconnects)
+
+    @staticmethod
+    def _entry_size(entry):
+        dn, attrs = entry
+        size = len(dn)
+        for attr, values in attrs.items():
+            size += len(attr)
+            for value in values:
+                size += len(value)
+        return size
+
+    def _record(self, check, wall, first, entries, size, retries):
+        if not check:
+            return
+
+        with self._record_lock:
+            transfer = self.transfer.setdefault(check, {'entries': 0, 'bytes': 0})
+            transfer['entries'] += entries
+            transfer['bytes'] += size
+
+            profile = self.profile.setdefault(check, {
+                'searches': 0,
+                'wall': 0.0,
+                'first_entry': None,
+                'entries': 0,
+                'bytes': 0,
+                'retries': 0
+            })
+            profile['searches'] += 1
+            profile['wall'] = round(profile['wall'] + wall, 6)
+            if first is not None and profile['first_entry'] is None:
+                profile['first_entry'] = round(first, 6)
+            profile['entries'] += entries
+            profile['bytes'] += size
+            profile['retries'] += retries
+
     def _get_fqdn(self):
         results = self._search(
             'cn=config',
@@ -244,109 +507,335 @@ class FreeIPAServer(object):
 
         return r
 
-    def _get_users(self, user_base):
-        if user_base == 'active':
-            user_base = 'cn=users,cn=accounts,{0}'.format(self._base_dn)
-        elif user_base == 'stage':
-            user_base = 'cn=staged users,cn=accounts,cn=provisioning,{0}'.format(self._base_dn)
-        elif user_base == 'preserved':
-            user_base = 'cn=deleted users,cn=accounts,cn=provisioning,{0}'.format(self._base_dn)
+    def _get_queries(self):
+        suffix = self._base_dn.replace('=', '\\3D').replace(',', '\\2C')
+        return {
+            'users': {
+                'base': 'cn=users,cn=accounts,{0}'.format(self._base_dn),
+                'fltr': '(objectClass=person)'
+            },
+            'susers': {
+                'base': 'cn=staged users,cn=accounts,cn=provisioning,{0}'.format(self._base_dn),
+                'fltr': '(objectClass=person)'
+            },
+            'pusers': {
+                'base': 'cn=deleted users,cn=accounts,cn=provisioning,{0}'.format(self._base_dn),
+                'fltr': '(objectClass=person)'
+            },
+            'hosts': {
+                'base': 'cn=computers,cn=accounts,{0}'.format(self._base_dn),
+                'fltr': '(fqdn=*)'
+            },
+            'services': {
+                'base': 'cn=services,cn=accounts,{0}'.format(self._base_dn),
+                'fltr': '(krbprincipalname=*)'
+            },
+            'ugroups': {
+                'base': 'cn=groups,cn=accounts,{0}'.format(self._base_dn),
+                'fltr': '(objectClass=ipausergroup)'
+            },
+            'hgroups': {
+                'base': 'cn=hostgroups,cn=accounts,{0}'.format(self._base_dn),
+                'fltr': '(objectClass=ipahostgroup)'
+            },
+            'ngroups': {
+                'base': 'cn=ng,cn=alt,{0}'.format(self._base_dn),
+                'fltr': '(ipaUniqueID=*)',
+                'scope': ldap.SCOPE_ONELEVEL
+            },
+            'hbac': {
+                'base': 'cn=hbac,{0}'.format(self._base_dn),
+                'fltr': '(ipaUniqueID=*)',
+                'scope': ldap.SCOPE_ONELEVEL
+            },
+            'sudo': {
+                'base': 'cn=sudorules,cn=sudo,{0}'.format(self._base_dn),
+                'fltr': '(ipaUniqueID=*)',
+                'scope': ldap.SCOPE_ONELEVEL
+            },
+            'zones': {
+                'base': 'cn=dns,{0}'.format(self._base_dn),
+                'fltr': '(|(objectClass=idnszone)(objectClass=idnsforwardzone))',
+                'scope': ldap.SCOPE_ONELEVEL
+            },
+            'certs': {
+                'base': 'ou=certificateRepository,ou=ca,o=ipaca',
+                'fltr': '(certStatus=*)',
+                'attrs': ['subjectName'],
+                'scope': ldap.SCOPE_ONELEVEL
+            },
+            'conflicts': {
+                'base': self._base_dn,
+                'fltr': '(|(nsds5ReplConflict=*)(&(objectclass=ldapsubentry)(nsds5ReplConflict=*)))',
+                'attrs': ['nsds5ReplConflict']
+            },
+            'ghosts': {
+                'base': self._base_dn,
+                'fltr': '(&(objectclass=nstombstone)(nsUniqueId=ffffffff-ffffffff-ffffffff-ffffffff))',
+                'attrs': ['nscpentrywsi']
+            },
+            'ruv': {
+                'base': 'nsuniqueid=ffffffff-ffffffff-ffffffff-ffffffff,{0}'.format(self._base_dn),
+                'fltr': '(objectClass=nsTombstone)',
+                'attrs': ['nsds50ruv'],
+                'scope': ldap.SCOPE_BASE
+            },
+            'bind': {
+                'base': 'cn=config',
+                'fltr': '(objectClass=*)',
+                'attrs': ['nsslapd-allow-anonymous-access'],
+                'scope': ldap.SCOPE_BASE
+            },
+            'replicas': {
+                'base': 'cn=replica,cn={0},cn=mapping tree,cn=config'.format(suffix),
+                'fltr': '(objectClass=*)',
+                'attrs': ['nsDS5ReplicaHost', 'nsds5replicaLastUpdateStatus', 'nsds5replicaLastUpdateEnd',
+                          'nsds5replicaUpdateInProgress'],
+                'scope': ldap.SCOPE_ONELEVEL
+            }
+        }
+
+    @staticmethod
+    def _query_key(base, fltr, attrs=None, scope=ldap.SCOPE_SUBTREE):
+        if attrs is not None:
+            attrs = tuple(attrs)
+        return base, fltr, attrs, scope
+
+    def prefetch(self, checks):
+        self._prefetched = dict()
+
+        if not self._pool:
+            return
+
+        with self._pool.connection() as conn:
+            self._prefetch(conn, checks)
+
+    def _prefetch(self, conn, checks):
+        pending = dict()
+        started = dict()
+        first = dict()
+        reconnects = self.reconnects
+        for check in checks:
+            query = self._queries.get(check)
+            if not query:
+                continue
+            key = self._query_key(**query)
+            if key in pending.values():
+                continue
+            try:
+                msgid = conn.search_ext(
+                    query['base'],
+                    query.get('scope', ldap.SCOPE_SUBTREE),
+                    query['fltr'],
+                    query.get('attrs')
+                )
+            except DOWN:
+                self._pool.discard(conn)
+                break
+            pending[msgid] = key
+            started[msgid] = time.time()
+            self._prefetched[key] = list()
+
+        while pending:
+            try:
+                rtype, rdata, msgid, _ = conn.result3(ldap.RES_ANY, all=0)
+            except (ldap.NO_SUCH_OBJECT, ldap.REFERRAL) as e:
+                msgid = self._get_ldap_msgid(e)
+                if msgid not in pending:
+                    break
+                key = pending.pop(msgid)
+                if isinstance(e, ldap.NO_SUCH_OBJECT):
+                    self._prefetched[key] = False
+                else:
+                    del self._prefetched[key]
+                continue
+            except DOWN:
+                self._pool.discard(conn)
+                break
+            if msgid not in pending:
+                continue
+            if rdata:
+                first.setdefault(msgid, time.time() - started[msgid])
+                self._prefetched[pending[msgid]].extend(rdata)
+            if rtype == ldap.RES_SEARCH_RESULT:
+                key = pending.pop(msgid)
+                results = self._prefetched[key]
+                size = 0
+                for entry in results:
+                    size += self._entry_size(entry)
+                self._record(
+                    self._query_checks.get(key),
+                    time.time() - started[msgid],
+                    first.get(msgid),
+                    len(results),
+                    size,
+                    self.reconnects - reconnects
+                )
+
+        for key in pending.values():
+            del self._prefetched[key]
+
+    def count(self, check):
         results = self._search(
-            user_base,
-            '(objectClass=person)'
+            self._queries[check]['base'],
+            '(objectClass=*)',
+            ['numSubordinates'],
+            scope=ldap.SCOPE_BASE,
+            check=check
         )
 
-        return results
+        if not results and type(results) is not list:
+            return False
 
-    def _get_groups(self):
+        dn, attrs = results[0]
+        r = 0
+        for attr, values in attrs.items():
+            if attr.lower() == 'numsubordinates':
+                r = int(values[0])
+
+        return r
+
+    def cert_summary(self, low=None, high=None):
+        base = self._queries['certs']['base']
+        count, highest = self._vlv_count(base, range_filter(low, high))
+        if count is False:
+            return False
+
+        r = {
+            'count': count,
+            'highest': highest
+        }
+
+        if low is None and high is None:
+            r['revoked'] = self._vlv_count(base, '(certStatus=REVOKED)')[0]
+            if r['revoked'] is False:
+                return False
+
+        return r
+
+    def cert_range(self, low, high):
         results = self._search(
-            'cn=groups,cn=accounts,{0}'.format(self._base_dn),
-            '(objectClass=ipausergroup)'
+            self._queries['certs']['base'],
+            range_filter(low, high),
+            ['1.1'],
+            scope=ldap.SCOPE_ONELEVEL,
+            check='certs'
         )
 
+        if not results and type(results) is not list:
+            return False
+
+        return self._compact(results)
+
+    def _vlv_count(self, base, fltr):
+        # A one entry virtual list view over a descending serialno sort returns
+        # the number of matching entries and the highest serial without
+        # transferring the entries themselves.
+        controls = dict()
+
+        def search(conn):
+            msgid = conn.search_ext(
+                base,
+                ldap.SCOPE_ONELEVEL,
+                fltr,
+                ['serialno'],
+                serverctrls=[
+                    SSSRequestControl(criticality=True, ordering_rules=['-serialno']),
+                    VLVRequestControl(criticality=True, before_count=0, after_count=0, offset=1, content_count=0)
+                ]
+            )
+            rtype, rdata, msgid, serverctrls = conn.result3(msgid)
+            for ctrl in serverctrls:
+                if ctrl.controlType == VLVResponseControl.controlType:
+                    controls['vlv'] = ctrl
+            return rdata
+
+        try:
+            results = list(self._measure('certs', lambda: self._pool.run(search)))
+        except (ldap.NO_SUCH_OBJECT, ldap.UNAVAILABLE_CRITICAL_EXTENSION, ldap.UNWILLING_TO_PERFORM) + DOWN:
+            return False, None
+
+        vlv = controls.get('vlv')
+        if vlv is None or vlv.virtualListViewResult != 0:
+            return False, None
+
+        highest = None
+        for dn, attrs in results:
+            for attr, values in attrs.items():
+                if attr.lower() == 'serialno':
+                    highest = decode_serial(values[0])
+
+        return vlv.contentCount, highest
+
+    def _has_ca(self):
+        try:
+            self._pool.run(lambda conn: conn.search_s('o=ipaca', ldap.SCOPE_BASE, '(objectClass=*)', ['1.1']))
+        except ldap.NO_SUCH_OBJECT:
+            return False
+        except DOWN:
+            self._errors += 1
+            return None
+        return True
+
+    @staticmethod
+    def _compact(results):
+        if not results:
+            return results
+        return [Entry.from_ldap(item) for item in results]
+
+    def _get_users(self, user_base):
+        check = {'active': 'users', 'stage': 'susers', 'preserved': 'pusers'}[user_base]
+        results = self._compact(self._search_check(check))
+
+        return results
+
+    def _get_groups(self):
+        results = self._compact(self._search(**self._queries['ugroups']))
+
         return results
 
     def _get_hosts(self):
-        results = self._search(
-            'cn=computers,cn=accounts,{0}'.format(self._base_dn),
-            '(fqdn=*)'
-        )
+        results = self._compact(self._search_check('hosts'))
 
         return results
 
     def _get_services(self):
-        results = self._search(
-            'cn=services,cn=accounts,{0}'.format(self._base_dn),
-            '(krbprincipalname=*)'
-        )
+        results = self._compact(self._search_check('services'))
 
         return results
 
     def _count_netgroups(self):
-        results = self._search(
-            'cn=ng,cn=alt,{0}'.format(self._base_dn),
-            '(ipaUniqueID=*)',
-            None,
-            scope=ldap.SCOPE_ONELEVEL
-        )
+        results = self._compact(self._search(**self._queries['ngroups']))
 
         return results
 
     def _get_hostgroups(self):
-        results = self._search(
-            'cn=hostgroups,cn=accounts,{0}'.format(self._base_dn),
-            '(objectClass=ipahostgroup)'
-        )
+        results = self._compact(self._search(**self._queries['hgroups']))
         return results
 
     def _get_hbac_rules(self):
-        results = self._search(
-            'cn=hbac,{0}'.format(self._base_dn),
-            '(ipaUniqueID=*)',
-            scope=ldap.SCOPE_ONELEVEL
-        )
+        results = self._compact(self._search(**self._queries['hbac']))
         return results
 
     def _get_sudo_rules(self):
-        results = self._search(
-            'cn=sudorules,cn=sudo,{0}'.format(self._base_dn),
-            '(ipaUniqueID=*)',
-            scope=ldap.SCOPE_ONELEVEL
-        )
+        results = self._compact(self._search(**self._queries['sudo']))
         return results
 
     def _get_dns_zones(self):
-        results = self._search(
-            'cn=dns,{0}'.format(self._base_dn),
-            '(|(objectClass=idnszone)(objectClass=idnsforwardzone))',
-            scope=ldap.SCOPE_ONELEVEL
-        )
+        results = self._compact(self._search(**self._queries['zones']))
         return results
 
     def _get_certificates(self):
-        results = self._search(
-            'ou=certificateRepository,ou=ca,o=ipaca',
-            '(certStatus=*)',
-            ['subjectName'],
-            scope=ldap.SCOPE_ONELEVEL
-        )
+        results = self._compact(self._search_check('certs'))
         return results
 
     def _get_ldap_conflicts(self):
-        results = self._search(
-            self._base_dn,
-            '(|(nsds5ReplConflict=*)(&(objectclass=ldapsubentry)(nsds5ReplConflict=*)))',
-            ['nsds5ReplConflict']
-        )
+        results = self._search(**self._queries['conflicts'])
 
         return results
 
     def _get_ghost_replicas(self):
-        results = self._search(
-            self._base_dn,
-            '(&(objectclass=nstombstone)(nsUniqueId=ffffffff-ffffffff-ffffffff-ffffffff))',
-            ['nscpentrywsi']
-        )
+        results = self._search(**self._queries['ghosts'])
 
         r = 0
 
@@ -359,13 +848,21 @@ class FreeIPAServer(object):
 
         return r
 
+    def _get_ruv(self):
+        results = self._search(**self._queries['ruv'])
+
+        if not results:
+            return None
+
+        dn, attrs = results[0]
+        for attr, values in attrs.items():
+            if attr.lower() == 'nsds50ruv':
+                return parse_ruv(values)
+
+        return None
+
     def _get_anon_bind(self):
-        results = self._search(
-            'cn=config',
-            '(objectClass=*)',
-            ['nsslapd-allow-anonymous-access'],
-            scope=ldap.SCOPE_BASE
-        )
+        results = self._search(**self._queries['bind'])
         dn, attrs = results[0]
         state = attrs['nsslapd-allow-anonymous-access'][0].decode('utf-8')
 
@@ -382,12 +879,12 @@ class FreeIPAServer(object):
         r = False
 
         try:
-            answers = dns.resolver.resolve(record, 'SRV')
-        except (dns.resolver.NXDOMAIN, dns.resolver.NoNameservers):
+            answers = self._resolver.resolve(record, 'SRV')
+        except ResolveError:
             return r
 
         for answer in answers:
-            if self._fqdn in answer.to_text():
+            if self._fqdn in answer:
                 r = True
                 return r
 
@@ -396,24 +893,36 @@ class FreeIPAServer(object):
     def _replication_agreements(self):
         msg = []
         healthy = True
-        suffix = self._base_dn.replace('=', '\\3D').replace(',', '\\2C')
-        results = self._search(
-            'cn=replica,cn={0},cn=mapping tree,cn=config'.format(suffix),
-            '(objectClass=*)',
-            ['nsDS5ReplicaHost', 'nsds5replicaLastUpdateStatus'],
-            scope=ldap.SCOPE_ONELEVEL
-        )
+        agreements = []
+        results = self._search(**self._queries['replicas'])
 
         for result in results:
             dn, attrs = result
-            host = attrs['nsDS5ReplicaHost'][0].decode('utf-8')
-            host = host.replace('.{0}'.format(self._domain), '')
+            fqdn = attrs['nsDS5ReplicaHost'][0].decode('utf-8')
+            host = fqdn.replace('.{0}'.format(self._domain), '')
             status = attrs['nsds5replicaLastUpdateStatus'][0].decode('utf-8')
             status = status.replace('Error ', '').partition(' ')[0].strip('()')
             if status not in ['0', '18']:
                 healthy = False
             msg.append('{0} {1}'.format(host, status))
 
+            last_update_end = None
+            for value in attrs.get('nsds5replicaLastUpdateEnd', []):
+                value = value.decode('utf-8')
+                # Agreements that never sent an update report zero or the
+                # epoch, which would otherwise read as decades of lag.
+                if value.strip('0Z') and value != '19700101000000Z':
+                    last_update_end = calendar.timegm(time.strptime(value, '%Y%m%d%H%M%SZ'))
+            in_progress = False
+            for value in attrs.get('nsds5replicaUpdateInProgress', []):
+                in_progress = value.decode('utf-8').upper() == 'TRUE'
+            agreements.append({
+                'host': fqdn,
+                'status': status,
+                'last_update_end': last_update_end,
+                'in_progress': in_progress
+            })
+
         r1 = '\n'.join(msg)
         r2 = healthy
-        return r1, r2
+        return r1, r2, agreements
@@ -21,21 +21,52 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import copy
 import json
 import os
+import signal
 import sys
+import threading
+import time
 import argparse
-from prettytable import PrettyTable
-import dns.resolver
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
-try:
-    import configparser
-except ImportError:
-    import ConfigParser as configparser
-
-import yaml
 from .__version__ import __version__
 from .freeipaserver import FreeIPAServer
+from .merge import ExternalSorter, iter_missing, missing
+from .digest import DigestTree, diverging_buckets
+from .duplicates import DuplicateIndex
+from .vector import THRESHOLD, missing_dns
+from . import certs
+from .ruv import in_sync, lag_matrix, max_csns
+from .resolver import ResolveError, Resolver
+from .snapshot import SnapshotStore
+from .scheduler import Scheduler
+
+DEFAULT_STORE = os.path.join(
+    os.path.expanduser(os.environ.get('XDG_DATA_HOME', '~/.local/share')),
+    'checkipaconsistency',
+    'runs.db'
+)
+
+_output_lock = threading.Lock()
+
+
+def _config_file():
+    return os.path.join(
+        os.path.expanduser(os.environ.get('XDG_CONFIG_HOME', '~/.config')),
+        os.path.splitext(__name__)[0]
+    )
+
+
+def _config_parser():
+    try:
+        import configparser
+    except ImportError:
+        import ConfigParser as configparser
+
+    return configparser.ConfigParser()
 
 
 class Checks(object):
@@ -43,11 +74,95 @@ class Checks(object):
         pass
 
 
-class Main(object):
+class Diff(object):
     def __init__(self):
+        self._parse_args()
+
+    def _parse_args(self):
+        parser = argparse.ArgumentParser(prog='{0} diff'.format(os.path.basename(sys.argv[0])),
+                                         description='Show what changed between two stored runs', add_help=False)
+        parser.add_argument('--since', type=int, dest='since', help='run ID to compare from')
+        parser.add_argument('--until', type=int, dest='until', default=None,
+                            help='run ID to compare to (default: latest run of the same domain)')
+        parser.add_argument('--store', dest='store', default=DEFAULT_STORE,
+                            help='SQLite store (default: {0})'.format(DEFAULT_STORE))
+        parser.add_argument('--list', action='store_true', dest='list', help='list stored runs and exit')
+        parser.add_argument('--help', action='help', help='show this help message and exit')
+        parser.add_argument('-o', '--output', nargs='?', dest='output', help='output type', default='cli',
+                            choices=['cli', 'json', 'yaml'])
+
+        args = parser.parse_args(sys.argv[2:])
+
+        if args.since is None and not args.list:
+            parser.error('argument --since is required')
+
+        self._args = args
+
+    def run(self):
+        if not os.path.isfile(self._args.store):
+            exit(1)
+
+        from .store import Store
+        store = Store(self._args.store)
+
+        if self._args.list:
+            for run_id, started, domain in store.runs():
+                print('{0} {1} {2}'.format(run_id, started, domain))
+            return
+
+        # A store shared by several realms holds the runs of each, so the
+        # latest run is taken from the domain of the --since run.
+        until = self._args.until or store.last_run(store.run_domain(self._args.since))
+        data = {
+            'since': self._args.since,
+            'until': until,
+            'checks': store.diff(self._args.since, until)
+        }
+        store.close()
+
+        if self._args.output == 'json':
+            print(json.dumps(data, indent=4, sort_keys=True))
+        elif self._args.output == 'yaml':
+            import yaml
+            print(yaml.dump(data))
+        elif self._args.output == 'cli':
+            self._output_cli(data)
+
+    @staticmethod
+    def _output_cli(data):
+        print("Changes between run {0} and run {1}...".format(data['since'], data['until']))
+        print("")
+
+        if not data['checks']:
+            print("no changes")
+            return
+
+        for check in sorted(data['checks']):
+            payload = data['checks'][check]
+            print("check {0}:".format(check))
+            for status, (old, new) in sorted(payload.get('status', dict()).items()):
+                print("{0} changed from {1} to {2}".format(status, old, new))
+            for server, server_payload in sorted(payload.get('servers', dict()).items()):
+                if 'result' in server_payload:
+                    old, new = server_payload['result']
+                    print("server {0} result changed from {1} to {2}".format(server, old, new))
+                for key in ['added', 'removed', 'missing_dn_new', 'missing_dn_resolved']:
+                    for dn in server_payload.get(key, []):
+                        print("server {0} {1}: {2}".format(server, key.replace('_', ' '), dn))
+            print("")
+
+
+class Main(object):
+    def __init__(self, argv=None, args=None, realm=None, limiter=None):
         self._app_name = os.path.basename(sys.modules['__main__'].__file__)
         self._app_dir = os.path.dirname(os.path.realpath(__file__))
-        self._parse_args()
+        if args is None:
+            self._parse_args(argv)
+        else:
+            self._args = args
+        self._realm = realm
+        self._limiter = limiter
+        self._streaming = self._args.output == 'ndjson' and not self._args.nagios_check
 
         self._domain = None
         self._hosts = []
@@ -55,7 +170,9 @@ class Main(object):
         self._bindpw = None
         self._data = dict()
 
-        self._load_config()
+        # The config file is only read for what the command line left out.
+        if realm or not (self._args.domain and self._args.hosts and self._args.binddn and self._args.bindpw):
+            self._load_config()
 
         if self._args.domain:
             self._domain = self._args.domain
@@ -70,17 +187,26 @@ class Main(object):
             if not host or ' ' in host:
                 exit(1)
 
+        self._resolver = Resolver(timeout=self._args.dns_timeout, cache_file=self._args.dns_cache)
+
+        records = list()
+        if not self._hosts:
+            records.append('_ldap._tcp.{0}'.format(self._domain))
+        if not self._args.nagios_check or self._args.nagios_check in ['all', 'msdcs']:
+            records.append('_kerberos._tcp.Default-First-Site-Name._sites.dc._msdcs.{0}'.format(self._domain))
+        if len(records) > 1:
+            self._resolver.prefetch(records)
+
         if not self._hosts:
-            record = '_ldap._tcp.{0}'.format(self._domain)
             answers = []
 
             try:
-                answers = dns.resolver.resolve(record, 'SRV')
-            except (dns.resolver.NXDOMAIN, dns.resolver.NoNameservers):
+                answers = self._resolver.resolve(records[0], 'SRV')
+            except ResolveError:
                 exit(1)
 
             for answer in answers:
-                self._hosts.append(str(answer).split(' ')[3].rstrip('.'))
+                self._hosts.append(answer.split(' ')[3].rstrip('.'))
 
         if self._args.binddn:
             self._binddn = self._args.binddn
@@ -94,67 +220,87 @@ class Main(object):
         if not self._bindpw:
             exit(1)
 
-        self._servers = dict()
-        for host in self._hosts:
-            self._servers[host] = FreeIPAServer(host, self._domain, self._binddn, self._bindpw)
-
+        # 'subordinates' is only set where the direct children of the base are
+        # exactly the check's entries, so numSubordinates can stand in for them.
         self._checks = {
             'users': {
                 'display_name': 'Active Users',
                 'duplicates': True,
-                'check_missing_dn': True
+                'check_missing_dn': True,
+                'attrs': ['ipaUniqueID'],
+                'subordinates': True
             },
             'susers': {
                 'display_name': 'Stage Users',
                 'duplicates': True,
-                'check_missing_dn': True
+                'check_missing_dn': True,
+                'attrs': ['ipaUniqueID'],
+                'subordinates': True
             },
             'pusers': {
                 'display_name': 'Preserved Users',
                 'duplicates': True,
-                'check_missing_dn': True
+                'check_missing_dn': True,
+                'attrs': ['ipaUniqueID'],
+                'subordinates': True
             },
             'hosts': {
                 'display_name': 'Hosts',
                 'duplicates': True,
-                'check_missing_dn': True
+                'check_missing_dn': True,
+                'attrs': ['ipaUniqueID'],
+                'subordinates': True
             },
             'services': {
                 'display_name': 'Services',
                 'duplicates': True,
-                'check_missing_dn': True
+                'check_missing_dn': True,
+                'attrs': ['ipaUniqueID'],
+                'subordinates': True
             },
             'ugroups': {
                 'display_name': 'User Groups',
                 'duplicates': True,
-                'check_missing_dn': True
+                'check_missing_dn': True,
+                'attrs': ['ipaUniqueID']
             },
             'hgroups': {
                 'display_name': 'Host Groups',
                 'duplicates': True,
-                'check_missing_dn': True
+                'check_missing_dn': True,
+                'attrs': ['ipaUniqueID'],
+                'subordinates': True
             },
             'ngroups': {
                 'display_name': 'Netgroups',
                 'duplicates': True,
-                'check_missing_dn': True
+                'check_missing_dn': True,
+                'attrs': ['ipaUniqueID'],
+                'subordinates': True
             },
             'hbac': {
                 'display_name': 'HBAC Rules',
                 'duplicates': 'cn',
-                'check_missing_dn': True
+                'check_missing_dn': True,
+                'attrs': ['cn', 'ipaUniqueID']
             },
             'sudo': {
                 'display_name': 'SUDO Rules',
                 'duplicates': 'cn',
-                'check_missing_dn': True
+                'check_missing_dn': True,
+                'attrs': ['cn', 'ipaUniqueID'],
+                'subordinates': True
             },
             'zones': {
                 'display_name': 'DNS Zones',
+                'attrs': ['1.1']
             },
             'certs': {
                 'display_name': 'Certificates',
-                'check_missing_dn': True
+                'check_missing_dn': True,
+                'attrs': ['1.1'],
+                'subordinates': True,
+                'suffix': 'o=ipaca'
             },
             'conflicts': {
                 'display_name': 'LDAP Conflicts'
@@ -173,7 +319,31 @@ class Main(object):
             }
         }
 
-    def _parse_args(self):
+        if self._args.nagios_check and self._args.nagios_check != 'all':
+            if self._args.nagios_check not in self._checks:
+                exit(3)
+            self._checks = {self._args.nagios_check: self._checks[self._args.nagios_check]}
+
+        attrs = dict()
+        for check, check_payload in self._checks.items():
+            if 'attrs' in check_payload:
+                attrs[check] = check_payload['attrs']
+
+        self._servers = dict()
+        with ThreadPoolExecutor(max_workers=self._args.workers) as executor:
+            futures = dict()
+            for host in self._hosts:
+                futures[host] = executor.submit(
+                    FreeIPAServer, host, self._domain, self._binddn, self._bindpw,
+                    attrs=attrs, page_size=self._args.page_size,
+                    pool_size=self._args.pool_size, keepalive=self._args.keepalive,
+                    cache_ttl=self._args.cache_ttl, error_ttl=self._args.error_ttl, resolver=self._resolver,
+                    shards=self._args.shards, limiter=self._limiter
+                )
+            for host in self._hosts:
+                self._servers[host] = futures[host].result()
+
+    def _parse_args(self, argv=None):
         parser = argparse.ArgumentParser(description='Tool to check consistency across FreeIPA servers', add_help=False)
         parser.add_argument('-H', '--hosts', nargs='*', dest='hosts', help='list of IPA servers')
         parser.add_argument('-d', '--domain', nargs='?', dest='domain', help='IPA domain')
@@ -190,27 +360,103 @@ class Main(object):
         parser.add_argument('--no-header', action='store_true', dest='disable_header', help='disable table header')
         parser.add_argument('--no-border', action='store_true', dest='disable_border', help='disable table border')
         parser.add_argument('-o', '--output', nargs='?', dest='output', help='output type', default='cli',
-                            choices=['cli', 'json', 'yaml'])
+                            choices=['cli', 'json', 'yaml', 'ndjson'])
+        parser.add_argument('-t', '--workers', type=int, dest='workers', default=8,
+                            help='number of IPA servers queried in parallel (default: 8)')
+        parser.add_argument('--pool-size', type=int, dest='pool_size', default=1,
+                            help='number of LDAP connections per IPA server (default: 1)')
+        parser.add_argument('--keepalive', type=int, dest='keepalive', default=60,
+                            help='seconds a connection may idle before it is probed (default: 60, 0 disables)')
+        parser.add_argument('--pipeline', action='store_true', dest='pipeline',
+                            help='send all searches to each server at once over a single connection')
+        parser.add_argument('--shards', type=int, dest='shards', default=0, metavar='N',
+                            help='split the users, hosts, services and certs searches into N shards run in '
+                                 'parallel over the connection pool (default: disabled)')
+        parser.add_argument('--page-size', type=int, dest='page_size', default=0,
+                            help='stream large searches in pages of this size (default: disabled)')
+        parser.add_argument('--fast-count', action='store_true', dest='fast_count',
+                            help='count entries with numSubordinates and only enumerate them when counts differ')
+        parser.add_argument('--ruv', action='store_true', dest='ruv',
+                            help='compare replica update vectors first and only count entries when they agree')
+        parser.add_argument('--dns-timeout', type=float, dest='dns_timeout', default=None, metavar='SECONDS',
+                            help='timeout of each DNS lookup (default: resolver settings)')
+        parser.add_argument('--dns-cache', nargs='?', dest='dns_cache', default=None, metavar='FILE',
+                            const=os.path.join(os.path.expanduser(os.environ.get('XDG_CACHE_HOME', '~/.cache')),
+                                               'checkipaconsistency', 'dns.json'),
+                            help='keep DNS answers on disk for their TTL (default FILE: %(const)s)')
+        parser.add_argument('--lag', action='store_true', dest='lag',
+                            help='report replication lag between servers derived from their RUVs')
+        parser.add_argument('--lag-warning', type=int, dest='lag_warning', default=300, metavar='SECONDS',
+                            help='replication lag before warning in Nagios mode (default: 300)')
+        parser.add_argument('--lag-critical', type=int, dest='lag_critical', default=900, metavar='SECONDS',
+                            help='replication lag before critical in Nagios mode (default: 900)')
+        parser.add_argument('--digest', action='store_true', dest='digest',
+                            help='compare hashed digests first and only list entries of diverging buckets')
+        parser.add_argument('--incremental', nargs='?', dest='incremental', default=None, metavar='DIR',
+                            const=os.path.join(os.path.expanduser(os.environ.get('XDG_CACHE_HOME', '~/.cache')),
+                                               'checkipaconsistency'),
+                            help='only fetch entries changed since the previous run, keeping snapshots in DIR '
+                                 '(default: ~/.cache/checkipaconsistency)')
+        parser.add_argument('--store', nargs='?', dest='store', default=None, const=DEFAULT_STORE, metavar='PATH',
+                            help='save results in a SQLite store (default: {0})'.format(DEFAULT_STORE))
+        parser.add_argument('--cache-ttl', type=int, dest='cache_ttl', default=None,
+                            help='seconds a check result stays cached (default: until invalidated)')
+        parser.add_argument('--error-ttl', type=int, dest='error_ttl', default=None,
+                            help='seconds a failed check result stays cached (default: as --cache-ttl)')
+        parser.add_argument('--show-transfer', action='store_true', dest='show_transfer',
+                            help='report entries and bytes fetched per check')
+        parser.add_argument('--show-cache', action='store_true', dest='show_cache',
+                            help='report cache hits and misses per check, and of DNS lookups')
+        parser.add_argument('--cert-summary', action='store_true', dest='cert_summary',
+                            help='compare certificate repositories of CA servers by summaries and serial ranges')
+        parser.add_argument('--cert-chunks', type=int, dest='cert_chunks', default=16, metavar='N',
+                            help='serial ranges to split a differing range into (default: 16)')
+        parser.add_argument('--vector-threshold', type=int, dest='vector_threshold', default=THRESHOLD, metavar='N',
+                            help='compare DN hashes with NumPy from N entries per check on (default: {0}, '
+                                 '0 disables)'.format(THRESHOLD))
+        parser.add_argument('--profile', action='store_true', dest='profile',
+                            help='record timings of every search and comparison phase')
+        parser.add_argument('-n', '--nagios', nargs='?', dest='nagios_check', const='all', default=None,
+                            metavar='CHECK', help='Nagios plugin mode (all checks or a single CHECK)')
+        parser.add_argument('-w', '--warning', type=int, dest='warning', default=1,
+                            help='number of failed checks before warning (default: 1)')
+        parser.add_argument('-c', '--critical', type=int, dest='critical', default=2,
+                            help='number of failed checks before critical (default: 2)')
+        self._add_arguments(parser)
+
+        args = parser.parse_args(argv)
+
+        if args.workers < 1:
+            parser.error('number of workers must be at least 1')
+
+        if args.pool_size < 1:
+            parser.error('pool size must be at least 1')
 
-        args = parser.parse_args()
+        if args.keepalive < 0:
+            parser.error('keepalive must not be negative')
+
+        if args.shards < 0:
+            parser.error('number of shards must not be negative')
+
+        if args.page_size < 0:
+            parser.error('page size must not be negative')
 
         if args.log_file is None:
             args.log_file = self._app_name + '.log'
 
         self._args = args
 
+    def _add_arguments(self, parser):
+        pass
+
     def _load_config(self):
-        config = configparser.ConfigParser()
-        file_dir = os.path.expanduser(os.environ.get('XDG_CONFIG_HOME', '~/.config'))
+        config = _config_parser()
+        config_file = _config_file()
+        file_dir = os.path.dirname(config_file)
 
         if not os.path.exists(file_dir):
             os.makedirs(file_dir)
 
-        config_file = os.path.join(
-            file_dir,
-            os.path.splitext(__name__)[0]
-        )
-
         if not os.path.isfile(config_file):
             config.add_section('IPA')
             config.set('IPA', 'DOMAIN', 'ipa.example.com')
@@ -223,44 +469,305 @@ class Main(object):
 
         config.read(config_file)
 
-        if not config.has_section('IPA'):
+        section = 'IPA' if self._realm is None else 'IPA:{0}'.format(self._realm)
+        if not config.has_section(section):
             return
 
-        if config.has_option('IPA', 'DOMAIN'):
-            self._domain = config.get('IPA', 'DOMAIN')
+        if config.has_option(section, 'DOMAIN'):
+            self._domain = config.get(section, 'DOMAIN')
 
-        if config.has_option('IPA', 'HOSTS'):
-            self._hosts = config.get('IPA', 'HOSTS')
+        if config.has_option(section, 'HOSTS'):
+            self._hosts = config.get(section, 'HOSTS')
             self._hosts = self._hosts.replace(',', ' ').split()
 
-        if config.has_option('IPA', 'BINDDN'):
-            self._binddn = config.get('IPA', 'BINDDN')
+        if config.has_option(section, 'BINDDN'):
+            self._binddn = config.get(section, 'BINDDN')
 
-        if config.has_option('IPA', 'BINDPW'):
-            self._bindpw = config.get('IPA', 'BINDPW')
+        if config.has_option(section, 'BINDPW'):
+            self._bindpw = config.get(section, 'BINDPW')
 
     def run(self):
-        self._compute_data()
+        try:
+            self._compute_data()
+            if self._args.store:
+                self._save_run()
+        finally:
+            self._close()
+        if self._args.nagios_check:
+            exit(self._output_nagios())
         if self._args.output == 'json':
             print(json.dumps(self._data, indent=4, sort_keys=True))
         elif self._args.output == 'yaml':
+            import yaml
             print(yaml.dump(self._data))
         elif self._args.output == 'cli':
             self._output_cli()
+        elif self._args.output == 'ndjson':
+            self._emit('meta', **self._data['meta'])
+
+    def _save_run(self):
+        entries = dict()
+        for check, check_payload in self._checks.items():
+            if not check_payload.get('check_missing_dn', False):
+                continue
+            if check in self._streams or self._is_deferred(check):
+                continue
+            for server, payload in self._servers.items():
+                data = getattr(payload, check)
+                if isinstance(data, list):
+                    entries[(check, server)] = data
+
+        from .store import Store
+        store = Store(self._args.store)
+        self._data['meta']['run'] = store.save_run(self._domain, self._data, entries, list(self._checks))
+        store.close()
+
+    def _collect_data(self):
+        self._streams = dict()
+        self._counts = dict()
+        self._certs = dict()
+        self._ruvs = dict()
+        self._ruv_in_sync = False
+        self._digests = dict()
+        self._buckets = dict()
+        self._incremental = set()
+        self._snapshots = None
+
+        if self._args.ruv or self._args.lag:
+            # The RUVs decide what the rest of the run compares, so they are
+            # read afresh on every run instead of coming from the cache.
+            for payload in self._servers.values():
+                payload.invalidate(['ruv'])
+            self._ruvs = self._map_parallel(self._servers, lambda payload: payload.ruv)
+            self._ruv_in_sync = self._args.ruv and in_sync(list(self._ruvs.values()))
+
+        if self._args.fast_count or self._ruv_in_sync:
+            for check, check_payload in self._checks.items():
+                if not check_payload.get('subordinates', False):
+                    continue
+                if not self._args.fast_count and check_payload.get('suffix'):
+                    continue
+                self._counts[check] = dict()
+            self._run_parallel(self._count_server)
+            for check, counts in list(self._counts.items()):
+                values = list(counts.values())
+                if any(value is False for value in values) or values.count(values[0]) != len(values):
+                    del self._counts[check]
+
+        if self._args.cert_summary and 'certs' in self._checks and 'certs' not in self._counts:
+            result = self._compare_certificates()
+            if result:
+                self._certs['certs'] = result
+
+        if self._args.digest:
+            for check, check_payload in self._checks.items():
+                if check not in self._counts and self._is_digested(check_payload):
+                    self._digests[check] = dict()
+            self._run_parallel(self._digest_server)
+            for check, trees in list(self._digests.items()):
+                trees = list(trees.values())
+                if any(tree is False for tree in trees):
+                    del self._digests[check]
+                    continue
+                buckets = diverging_buckets(trees)
+                if buckets:
+                    del self._digests[check]
+                    self._buckets[check] = buckets
+
+        for check, check_payload in self._checks.items():
+            if self._is_deferred(check):
+                continue
+            if check in self._buckets or self._is_streamed(check_payload):
+                self._streams[check] = dict()
+            elif self._args.incremental and check_payload.get('check_missing_dn', False):
+                self._incremental.add(check)
+
+        if self._incremental:
+            self._snapshots = SnapshotStore(self._args.incremental)
+
+        if self._streaming:
+            self._start_collection()
+        else:
+            self._run_parallel(self._collect_server)
+
+    def _start_collection(self):
+        # Checks are compared and written out while later ones are still being
+        # collected, so each server reports every check it has finished.
+        self._collected = threading.Condition()
+        self._pending = dict()
+        for check in self._checks:
+            if not self._is_deferred(check):
+                self._pending[check] = len(self._servers)
+        self._executor = ThreadPoolExecutor(max_workers=self._args.workers)
+        self._futures = list()
+        for server, payload in self._servers.items():
+            self._futures.append(self._executor.submit(self._collect_server, server, payload))
+
+    def _check_collected(self, check):
+        if not self._streaming:
+            return
+        with self._collected:
+            self._pending[check] -= 1
+            self._collected.notify_all()
+
+    def _wait_collected(self, check):
+        if not self._streaming:
+            return
+        with self._collected:
+            while self._pending.get(check):
+                self._collected.wait()
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+
+    def _finish_collection(self):
+        if not self._streaming:
+            return
+        for future in self._futures:
+            future.result()
+        self._executor.shutdown()
+
+    def _run_parallel(self, fn):
+        with ThreadPoolExecutor(max_workers=self._args.workers) as executor:
+            futures = list()
+            for server, payload in self._servers.items():
+                futures.append(executor.submit(fn, server, payload))
+            for future in futures:
+                future.result()
+
+    def _map_parallel(self, servers, fn):
+        with ThreadPoolExecutor(max_workers=self._args.workers) as executor:
+            futures = dict()
+            for server, payload in servers.items():
+                futures[server] = executor.submit(fn, payload)
+            return dict((server, future.result()) for server, future in futures.items())
+
+    def _compare_certificates(self):
+        cas = self._map_parallel(self._servers, lambda payload: payload.ca)
+        if None in cas.values():
+            return False
+
+        servers = dict((server, self._servers[server]) for server, ca in cas.items() if ca)
+        if not servers:
+            return False
+
+        return certs.compare(servers, self._map_parallel, chunks=self._args.cert_chunks)
+
+    def _count_server(self, server, payload):
+        for check in self._counts:
+            self._counts[check][server] = payload.count(check)
+
+    def _digest_server(self, server, payload):
+        for check in self._digests:
+            self._digests[check][server] = payload.digest(check)
+
+    def _collect_server(self, server, payload):
+        pending = [check for check in self._checks if not self._is_deferred(check)]
+        try:
+            if self._args.pipeline:
+                payload.prefetch([check for check in pending if check not in self._streams and
+                                  check not in self._incremental])
+            for check in list(pending):
+                if check in self._streams:
+                    self._stream_check(server, payload, check, self._checks[check])
+                elif check in self._incremental:
+                    self._sync_check(server, payload, check)
+                else:
+                    getattr(payload, check)
+                pending.remove(check)
+                self._check_collected(check)
+        finally:
+            for check in pending:
+                self._check_collected(check)
+
+    def _sync_check(self, server, payload, check):
+        snapshot = payload.sync(check, self._snapshots.load(server, check),
+                                self._checks[check].get('subordinates', False))
+        if snapshot is not False:
+            self._snapshots.save(server, check, snapshot)
+
+    def _is_deferred(self, check):
+        return check in self._counts or check in self._digests or check in self._certs
+
+    @staticmethod
+    def _is_digested(check_payload):
+        if not check_payload.get('check_missing_dn', False):
+            return False
+        return check_payload.get('duplicates', False) in [False, True]
+
+    def _is_streamed(self, check_payload):
+        if not self._args.page_size:
+            return False
+        return check_payload.get('check_missing_dn', False) or check_payload.get('duplicates', False)
+
+    def _stream_check(self, server, payload, check, check_payload):
+        dns = ExternalSorter()
+        identifiers = DuplicateIndex(self._servers, by_cn=isinstance(check_payload.get('duplicates'), str))
+        check_missing_dn = check_payload.get('check_missing_dn', False)
+        identifier = check_payload.get('duplicates', False)
+        buckets = self._buckets.get(check)
+
+        def consume(entry):
+            if buckets is not None and DigestTree.bucket(entry.dn) not in buckets:
+                return
+            if check_missing_dn:
+                dns.add(entry.dn)
+            if identifier:
+                identifiers.add(server, [entry])
+
+        result = payload.stream(check, consume)
+        self._streams[check][server] = {
+            'result': result,
+            'dns': dns,
+            'identifiers': identifiers
+        }
 
     def _compute_data(self):
-        self._data['checks'] = dict()
+        self._timings = dict()
+        start = time.time()
+        self._collect_data()
+        collect = time.time() - start
+        self._data.setdefault('checks', dict())
         self._data['meta'] = dict()
         self._data['meta']['servers'] = dict()
         for server, payload in self._servers.items():
             self._data['meta']['servers'][server] = payload.hostname_short
+        if self._args.ruv:
+            self._data['meta']['ruv'] = {
+                'in_sync': self._ruv_in_sync,
+                'servers': dict()
+            }
+            for server, ruv in self._ruvs.items():
+                self._data['meta']['ruv']['servers'][server] = max_csns(ruv) if ruv else None
+        if self._args.lag:
+            self._data['meta']['lag'] = self._replication_lag()
+        if self._args.show_transfer:
+            self._data['meta']['transfer'] = dict()
+            for server, payload in self._servers.items():
+                self._data['meta']['transfer'][server] = payload.transfer
         for check, check_payload in self._checks.items():
+            self._wait_collected(check)
             _check_result = dict()
             _check_result['display_name'] = check_payload['display_name']
             _check_result['servers'] = dict()
             _numbers = list()
             for server, payload in self._servers.items():
-                data = getattr(payload, check)
+                if check in self._counts:
+                    data = self._counts[check][server]
+                elif check in self._certs:
+                    data = self._certs[check]['summary'].get(server)
+                    if data is None:
+                        _check_result['servers'][server] = {'result': 'N/A'}
+                    else:
+                        _check_result['servers'][server] = {'result': data['count'], 'summary': data}
+                        _numbers.append((data['count'], data['highest'], data['revoked']))
+                    continue
+                elif check in self._digests:
+                    data = self._digests[check][server].count
+                elif check in self._streams:
+                    data = self._streams[check][server]['result']
+                else:
+                    data = getattr(payload, check)
                 _check_result['servers'][server] = dict()
                 if isinstance(data, list):
                     _check_result['servers'][server]['result'] = len(data)
@@ -268,15 +775,93 @@ class Main(object):
                 else:
                     _check_result['servers'][server]['result'] = data
                     _numbers.append(data)
+            start = time.time()
             _check_result['status_item_count'] = self._check_item_count(check, _numbers)
+            self._record_timing(check, 'item_count', start)
             self._data['checks'][check] = _check_result
-            if check_payload.get('check_missing_dn', False):
-                self._check_missing_dn(check=check)
-            if check_payload.get('duplicates', False):
-                self._duplicates(
-                    check=check,
-                    identifier=check_payload.get('duplicates')
-                )
+            if self._streaming:
+                for server, server_result in _check_result['servers'].items():
+                    self._emit('result', check=check, server=server, **server_result)
+            self._compare_check(check, check_payload)
+            if self._streaming:
+                self._emit_status(check)
+        self._finish_collection()
+
+        if self._args.profile:
+            self._data['meta']['timings'] = {
+                'collect': round(collect, 6),
+                'compare': self._timings,
+                'servers': dict()
+            }
+            for server, payload in self._servers.items():
+                self._data['meta']['timings']['servers'][server] = payload.profile
+
+        if self._args.show_cache:
+            self._data['meta']['cache'] = dict()
+            for server, payload in self._servers.items():
+                self._data['meta']['cache'][server] = payload.cache.stats()
+            self._data['meta']['dns'] = self._resolver.stats()
+
+    def _compare_check(self, check, check_payload):
+        if check in self._counts:
+            return
+        if check in self._certs:
+            self._store_missing_dn(check, self._certs[check]['missing_dn'])
+            return
+        if check in self._digests:
+            self._store_digest_consistent(check, check_payload)
+            return
+        if check_payload.get('check_missing_dn', False):
+            start = time.time()
+            self._check_missing_dn(check=check)
+            self._record_timing(check, 'missing_dn', start)
+        if check_payload.get('duplicates', False):
+            start = time.time()
+            self._duplicates(
+                check=check,
+                identifier=check_payload.get('duplicates')
+            )
+            self._record_timing(check, 'duplicates', start)
+
+    def _replication_lag(self):
+        lag = {
+            'matrix': lag_matrix(self._ruvs),
+            'agreements': dict(),
+            'max': 0
+        }
+
+        now = time.time()
+        servers = dict((payload.fqdn, server) for server, payload in self._servers.items())
+        for supplier, payload in self._servers.items():
+            lag['agreements'][supplier] = dict()
+            for agreement in payload.agreements:
+                consumer = servers.get(agreement['host'], agreement['host'])
+                age = None
+                if agreement['last_update_end'] is not None:
+                    age = max(0, int(now - agreement['last_update_end']))
+                lag['agreements'][supplier][consumer] = {
+                    'last_update_age': age,
+                    'in_progress': agreement['in_progress']
+                }
+
+        for consumers in lag['matrix'].values():
+            for seconds in consumers.values():
+                lag['max'] = max(lag['max'], seconds)
+
+        return lag
+
+    def _record_timing(self, check, phase, start):
+        if self._args.profile:
+            self._timings.setdefault(check, dict())[phase] = round(time.time() - start, 6)
+
+    def _store_digest_consistent(self, check, check_payload):
+        missing_dn = dict()
+        for server in self._servers:
+            missing_dn[server] = list()
+        self._store_missing_dn(check, missing_dn)
+        if check_payload.get('duplicates', False):
+            self._data['checks'][check]['duplicates'] = dict()
+            self._data['checks'][check]['status_duplicates'] = True
 
     def _output_cli(self):
         table_header = list()
@@ -284,12 +869,7 @@ class Main(object):
         for payload in self._data['meta']['servers'].values():
             table_header.append(payload)
         table_header.append('COUNT')
-        table = PrettyTable(
-            table_header,
-            header=not self._args.disable_header,
-            border=not self._args.disable_border
-        )
-        table.align = 'l'
+        table = self._table(table_header)
 
         for check, payload in self._data['checks'].items():
             data = list()
@@ -305,9 +885,153 @@ class Main(object):
 
         print(table)
 
+        if self._args.show_transfer:
+            self._output_cli_meta('Transfer (entries/bytes):', self._data['meta']['transfer'], '{entries}/{bytes}')
+        if self._args.show_cache:
+            self._output_cli_meta('Cache (hits/misses):', self._data['meta']['cache'], '{hits}/{misses}')
+            print('DNS cache (hits/lookups): {hits}/{lookups}'.format(**self._data['meta']['dns']))
+        if self._args.lag:
+            self._output_cli_lag()
+        if self._args.profile:
+            self._output_cli_meta('Timing (wall/first/retries):', self._data['meta']['timings']['servers'],
+                                  '{wall:.3f}s/{first_entry}/{retries}')
+            self._output_cli_timings()
         self._output_cli_missing_dn()
         self._output_cli_duplicates()
 
+    def _table(self, header):
+        from prettytable import PrettyTable
+        table = PrettyTable(
+            header,
+            header=not self._args.disable_header,
+            border=not self._args.disable_border
+        )
+        table.align = 'l'
+        return table
+
+    def _output_cli_meta(self, title, values, fmt):
+        table_header = list()
+        table_header.append(title)
+        for payload in self._data['meta']['servers'].values():
+            table_header.append(payload)
+        table = self._table(table_header)
+
+        for check, payload in self._data['checks'].items():
+            data = list()
+            data.append(payload['display_name'])
+            for server in self._data['meta']['servers'].keys():
+                value = values[server].get(check)
+                if value:
+                    data.append(fmt.format(**value))
+                else:
+                    data.append('-')
+            table.add_row(data)
+
+        print(table)
+
+    def _output_cli_lag(self):
+        lag = self._data['meta']['lag']
+        servers = self._data['meta']['servers']
+        table = self._table(['Replication lag (s):'] + list(servers.values()))
+
+        for supplier, name in servers.items():
+            data = list()
+            data.append(name)
+            for consumer in servers:
+                if consumer == supplier:
+                    data.append('-')
+                else:
+                    data.append(lag['matrix'].get(supplier, dict()).get(consumer, 'N/A'))
+            table.add_row(data)
+
+        print(table)
+        print("")
+
+    def _output_cli_timings(self):
+        phases = ['item_count', 'missing_dn', 'duplicates']
+        table = self._table(['Comparison (s):'] + phases)
+
+        for check, payload in self._data['checks'].items():
+            timings = self._data['meta']['timings']['compare'].get(check, dict())
+            data = list()
+            data.append(payload['display_name'])
+            for phase in phases:
+                if phase in timings:
+                    data.append('{0:.3f}'.format(timings[phase]))
+                else:
+                    data.append('-')
+            table.add_row(data)
+
+        print(table)
+        print("collection took {0:.3f}s".format(self._data['meta']['timings']['collect']))
+        print("")
+
+    def _output_nagios(self):
+        failed = list()
+        for check, payload in self._data['checks'].items():
+            for status in ['status_item_count', 'status_missing_dn', 'status_duplicates']:
+                if payload.get(status) is False:
+                    failed.append(check)
+                    break
+
+        total = len(self._data['checks'])
+        if len(failed) >= self._args.critical:
+            code, state = 2, 'CRITICAL'
+        elif len(failed) >= self._args.warning:
+            code, state = 1, 'WARNING'
+        else:
+            code, state = 0, 'OK'
+
+        if self._args.lag:
+            lag = self._data['meta']['lag']['max']
+            if lag >= self._args.lag_critical:
+                code, state = 2, 'CRITICAL'
+            elif lag >= self._args.lag_warning and code < 1:
+                code, state = 1, 'WARNING'
+
+        if self._args.nagios_check == 'all':
+            msg = '{0} - {1}/{2} checks passed'.format(state, total - len(failed), total)
+        else:
+            msg = '{0} - {1}'.format(state, self._data['checks'][self._args.nagios_check]['display_name'])
+
+        if self._args.lag:
+            msg = '{0}, replication lag {1}s'.format(msg, self._data['meta']['lag']['max'])
+
+        print('{0} | {1}'.format(msg, ' '.join(self._nagios_perfdata(len(failed), total))))
+        return code
+
+    def _nagios_perfdata(self, failed, total):
+        perfdata = list()
+        perfdata.append('failed={0};{1};{2};0;{3}'.format(failed, self._args.warning, self._args.critical, total))
+
+        if self._args.lag:
+            lag = self._data['meta']['lag']
+            thresholds = '{0};{1};0'.format(self._args.lag_warning, self._args.lag_critical)
+            perfdata.append('lag_max={0}s;{1}'.format(lag['max'], thresholds))
+            names = self._data['meta']['servers']
+            for supplier in sorted(lag['matrix']):
+                for consumer in sorted(lag['matrix'][supplier]):
+                    perfdata.append("'lag_{0}_{1}'={2}s;{3}".format(
+                        names[supplier], names[consumer], lag['matrix'][supplier][consumer], thresholds))
+
+        if not self._args.profile:
+            return perfdata
+
+        timings = self._data['meta']['timings']
+        perfdata.append('collect={0}s'.format(timings['collect']))
+        for check in sorted(self._data['checks']):
+            for server in sorted(timings['servers']):
+                profile = timings['servers'][server].get(check)
+                if not profile:
+                    continue
+                label = '{0}_{1}'.format(check, self._data['meta']['servers'][server])
+                perfdata.append("'{0}_wall'={1}s".format(label, profile['wall']))
+                perfdata.append("'{0}_entries'={1}".format(label, profile['entries']))
+                perfdata.append("'{0}_bytes'={1}B".format(label, profile['bytes']))
+            compare = sum(timings['compare'].get(check, dict()).values())
+            perfdata.append("'{0}_compare'={1}s".format(check, round(compare, 6)))
+        return perfdata
+
     def _output_cli_missing_dn(self):
         print("Missing DN´s...")
         print("")
@@ -324,8 +1048,10 @@ class Main(object):
             print("status for {0} shows issues".format(display_name))
             print("")
             for server in self._data['meta']['servers'].keys():
+                if 'missing_dn' not in payload['servers'][server]:
+                    continue
                 print("server {0} is missing these dn´s:".format(server))
-                for dn in payload['missing_dn']:
+                for dn in payload['servers'][server]['missing_dn']:
                     print(dn)
                 print("")
             print("")
@@ -381,68 +1107,366 @@ class Main(object):
                 return False
 
     def _duplicates(self, check, identifier):
-        all_identifiers = dict()
+        index = DuplicateIndex(self._servers, by_cn=isinstance(identifier, str))
 
         for server, payload in self._servers.items():
-            data = getattr(payload, check)
-            for item in data:
-                dn = str(item[0])
-                if isinstance(identifier, str):
-                    _identifier = str(item[1]['cn'][0])
-                else:
-                    _identifier = str(item[0])
-                uniq_id = str(item[1]['ipaUniqueID'][0])
-                if _identifier not in all_identifiers:
-                    all_identifiers[_identifier] = dict()
-                    all_identifiers[_identifier]['identifiers'] = set()
-                    all_identifiers[_identifier]['servers'] = dict()
-                    all_identifiers[_identifier]['dn'] = dict()
-                all_identifiers[_identifier]['identifiers'].add(uniq_id)
-                if server not in all_identifiers[_identifier]['servers']:
-                    all_identifiers[_identifier]['servers'][server] = set()
-                all_identifiers[_identifier]['servers'][server].add(uniq_id)
-                if dn not in all_identifiers[_identifier]['dn']:
-                    all_identifiers[_identifier]['dn'][dn] = set()
-                all_identifiers[_identifier]['dn'][dn].add(uniq_id)
+            if check in self._streams:
+                index.update(self._streams[check][server]['identifiers'])
+                continue
+            index.add(server, getattr(payload, check))
 
         self._data['checks'][check]['duplicates'] = dict()
         self._data['checks'][check]['status_duplicates'] = True
 
-        for _identifier, payload in all_identifiers.items():
-            if len(payload['identifiers']) > 1:
-                self._data['checks'][check]['status_duplicates'] = False
-                for server, server_values in payload['servers'].items():
-                    if 'duplicates' not in self._data['checks'][check]['servers'][server]:
-                        self._data['checks'][check]['servers'][server]['duplicates'] = dict()
-                    self._data['checks'][check]['servers'][server]['duplicates'][_identifier] = list(server_values)
-                for dn, dn_values in payload['dn'].items():
-                    if _identifier not in self._data['checks'][check]['duplicates']:
-                        self._data['checks'][check]['duplicates'][_identifier] = dict()
-                    self._data['checks'][check]['duplicates'][_identifier][dn] = list(dn_values)
+        for _identifier, payload in index.collisions():
+            self._data['checks'][check]['status_duplicates'] = False
+            if self._streaming:
+                self._emit('duplicate', check=check, identifier=_identifier,
+                           dn=dict((dn, list(dn_values)) for dn, dn_values in payload['dn'].items()),
+                           servers=dict((server, list(values)) for server, values in payload['servers'].items()))
+                continue
+            for server, server_values in payload['servers'].items():
+                if 'duplicates' not in self._data['checks'][check]['servers'][server]:
+                    self._data['checks'][check]['servers'][server]['duplicates'] = dict()
+                self._data['checks'][check]['servers'][server]['duplicates'][_identifier] = list(server_values)
+            for dn, dn_values in payload['dn'].items():
+                if _identifier not in self._data['checks'][check]['duplicates']:
+                    self._data['checks'][check]['duplicates'][_identifier] = dict()
+                self._data['checks'][check]['duplicates'][_identifier][dn] = list(dn_values)
 
     def _check_missing_dn(self, check):
-        status_ok = True
-        all_dns = set()
+        if check in self._streams:
+            streams = dict()
+            for server in self._servers:
+                streams[server] = self._streams[check][server]['dns']
+            if self._streaming:
+                self._emit_missing_dn(check, iter_missing(streams))
+            else:
+                self._store_missing_dn(check, missing(streams))
+            return
+
         servers = dict()
         for server, payload in self._servers.items():
-            data = getattr(payload, check)
-            server_items = set()
-            for item in data:
-                server_items.add(item[0])
-                all_dns.add(item[0])
-            servers[server] = server_items
-
-        for server, items in servers.items():
-            delta = all_dns.difference(items)
+            servers[server] = getattr(payload, check)
+        self._store_missing_dn(check, missing_dns(servers, self._args.vector_threshold))
+
+    def _store_missing_dn(self, check, missing_dn):
+        if self._streaming:
+            self._emit_missing_dn(check, ((server, dn) for server, delta in missing_dn.items() for dn in delta))
+            return
+        status_ok = True
+        for server, delta in missing_dn.items():
             if delta:
                 status_ok = False
-            self._data['checks'][check]['servers'][server]['missing_dn'] = list(delta)
+            self._data['checks'][check]['servers'][server]['missing_dn'] = delta
+        self._data['checks'][check]['status_missing_dn'] = status_ok
+
+    def _emit_missing_dn(self, check, missing_dn):
+        # DNs are written as they are found and only kept when --store needs them.
+        status_ok = True
+        servers = self._data['checks'][check]['servers']
+        for server, dn in missing_dn:
+            status_ok = False
+            self._emit('missing_dn', check=check, server=server, dn=dn)
+            if self._args.store:
+                servers[server].setdefault('missing_dn', list()).append(dn)
         self._data['checks'][check]['status_missing_dn'] = status_ok
 
+    def _emit_status(self, check):
+        status = dict()
+        for key, value in self._data['checks'][check].items():
+            if key.startswith('status_'):
+                status[key] = value
+        self._emit('check', check=check, display_name=self._data['checks'][check]['display_name'], **status)
+
+    def _emit(self, record_type, **fields):
+        fields['type'] = record_type
+        if self._realm is not None:
+            fields['realm'] = self._realm
+        with _output_lock:
+            sys.stdout.write(json.dumps(fields, sort_keys=True) + '\n')
+            sys.stdout.flush()
+
+    def _close(self):
+        for payload in self._servers.values():
+            payload.close()
+
+
+class Daemon(Main):
+    def __init__(self, argv=None):
+        super(Daemon, self).__init__(argv)
+        self._streaming = False
+        self._all_checks = self._checks
+        self._published = dict()
+        self._last_run = dict()
+        self._last_success = None
+        self._failures = 0
+
+        self._intervals = dict()
+        for item in self._args.check_intervals:
+            check, _, interval = item.partition('=')
+            if check not in self._all_checks or not interval.isdigit() or int(interval) < 1:
+                exit(1)
+            self._intervals[check] = int(interval)
+
+        for check in self._all_checks:
+            for payload in self._servers.values():
+                payload.cache.set_ttl(check, self._intervals.get(check, self._args.interval))
+
+    def _add_arguments(self, parser):
+        parser.prog = '{0} serve'.format(os.path.basename(sys.argv[0]))
+        parser.add_argument('--listen', dest='listen', default='127.0.0.1',
+                            help='address to serve metrics on (default: 127.0.0.1)')
+        parser.add_argument('--port', type=int, dest='port', default=9470,
+                            help='port to serve metrics on (default: 9470)')
+        parser.add_argument('--interval', type=int, dest='interval', default=300,
+                            help='seconds between runs of each check (default: 300)')
+        parser.add_argument('--check-interval', action='append', dest='check_intervals', default=[],
+                            metavar='CHECK=SECONDS', help='override the interval of a single check')
+
+    def run(self):
+        try:
+            from http.server import HTTPServer
+        except ImportError:
+            from BaseHTTPServer import HTTPServer
+
+        httpd = HTTPServer((self._args.listen, self._args.port), self._get_handler())
+        thread = threading.Thread(target=httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        # SIGTERM stops the daemon the same way as Ctrl-C.
+        signal.signal(signal.SIGTERM, lambda signum, frame: exit(0))
+
+        due = dict()
+        for check in self._all_checks:
+            due[check] = 0
+
+        try:
+            while True:
+                now = time.time()
+                checks = [check for check in self._all_checks if due[check] <= now]
+                if checks:
+                    self._run_cycle(checks)
+                    for check in checks:
+                        due[check] = now + self._intervals.get(check, self._args.interval)
+                time.sleep(max(0, min(due.values()) - time.time()))
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+            self._close()
+
+    def _run_cycle(self, checks):
+        # A failed run leaves the last good results published, so an
+        # unreachable server shows up as a failure count and an ageing last
+        # success instead of stopping the daemon.
+        try:
+            self._run_checks(checks)
+        except (SystemExit, Exception) as e:
+            self._failures += 1
+            sys.stderr.write('Run of {0} failed: {1}: {2}\n'.format(', '.join(sorted(checks)), type(e).__name__, e))
+        else:
+            self._last_success = time.time()
+
+        published = dict(self._published)
+        published['meta'] = dict(published.get('meta', dict()))
+        published['meta']['failures'] = self._failures
+        published['meta']['last_success'] = self._last_success
+        self._published = published
+
+    def _run_checks(self, checks):
+        self._checks = dict()
+        for check in checks:
+            self._checks[check] = self._all_checks[check]
+        for payload in self._servers.values():
+            payload.invalidate(checks)
+
+        self._compute_data()
+        if self._args.store:
+            self._save_run()
+        for check in checks:
+            self._last_run[check] = time.time()
+        self._data['meta']['last_run'] = dict(self._last_run)
+        self._published = copy.deepcopy(self._data)
+
+    def _get_handler(self):
+        try:
+            from http.server import BaseHTTPRequestHandler
+        except ImportError:
+            from BaseHTTPServer import BaseHTTPRequestHandler
+        from .metrics import prometheus
+
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = prometheus(daemon._published)
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path in ['/', '/json']:
+                    body = json.dumps(daemon._published, indent=4, sort_keys=True)
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class Batch(Main):
+    def __init__(self, argv=None):
+        self._app_name = os.path.basename(sys.modules['__main__'].__file__)
+        self._app_dir = os.path.dirname(os.path.realpath(__file__))
+        self._parse_args(argv)
+        self._realm = None
+        self._data = dict()
+
+        if self._args.nagios_check:
+            exit(1)
+
+        if self._args.max_connections < 1 or self._args.realm_connections < 1:
+            exit(1)
+
+        self._realms = self._load_realms()
+        if not self._realms:
+            exit(1)
+
+    def _add_arguments(self, parser):
+        parser.prog = '{0} batch'.format(os.path.basename(sys.argv[0]))
+        parser.add_argument('--realms', nargs='*', dest='realms', default=None, metavar='REALM',
+                            help='realms to check (default: every [IPA:REALM] config section)')
+        parser.add_argument('--max-connections', type=int, dest='max_connections', default=16,
+                            help='LDAP connections open at once across all realms (default: 16)')
+        parser.add_argument('--realm-connections', type=int, dest='realm_connections', default=4,
+                            help='LDAP connections open at once per realm, unless its section sets CONNECTIONS '
+                                 '(default: 4)')
+        parser.add_argument('--stagger', type=float, dest='stagger', default=1.0, metavar='SECONDS',
+                            help='delay between the starts of consecutive realms (default: 1)')
+
+    def _load_realms(self):
+        config = _config_parser()
+        config.read(_config_file())
+
+        realms = list()
+        for section in config.sections():
+            if not section.startswith('IPA:'):
+                continue
+            realm = section[len('IPA:'):]
+            if self._args.realms and realm not in self._args.realms:
+                continue
+            connections = self._args.realm_connections
+            if config.has_option(section, 'CONNECTIONS'):
+                connections = config.getint(section, 'CONNECTIONS')
+            realms.append((realm, connections))
+
+        for realm in self._args.realms or []:
+            if realm not in [name for name, _ in realms]:
+                exit(1)
+
+        return realms
+
+    def _run_realm(self, realm, limiter):
+        # A failing realm is reported in the combined report instead of
+        # stopping the others.
+        try:
+            main = Main(args=self._args, realm=realm, limiter=limiter)
+            main._compute_data()
+            if self._args.store:
+                main._save_run()
+        except SystemExit as e:
+            return None, 'exit code {0}'.format(e.code)
+        except Exception as e:
+            return None, '{0}: {1}'.format(type(e).__name__, e)
+        finally:
+            limiter.close()
+
+        return main, None
+
+    def run(self):
+        scheduler = Scheduler(self._args.max_connections, stagger=self._args.stagger)
+        jobs = list()
+        for realm, connections in self._realms:
+            jobs.append((realm, connections, functools.partial(self._run_realm, realm)))
+
+        start = time.time()
+        results = scheduler.run(jobs)
+        wall = time.time() - start
+
+        self._data['realms'] = dict()
+        self._data['meta'] = {
+            'wall': round(wall, 3),
+            'connections': {
+                'limit': scheduler.limit,
+                'peak': scheduler.peak,
+                'realms': dict()
+            }
+        }
+        for realm, _ in self._realms:
+            main, error = results[realm]
+            if main is None:
+                self._data['realms'][realm] = {'error': error}
+            else:
+                self._data['realms'][realm] = main._data
+            limiter = scheduler.limiters[realm]
+            self._data['meta']['connections']['realms'][realm] = {
+                'limit': limiter.limit,
+                'peak': limiter.peak,
+                'started': scheduler.started[realm]
+            }
+
+        if self._args.output == 'json':
+            print(json.dumps(self._data, indent=4, sort_keys=True))
+        elif self._args.output == 'yaml':
+            import yaml
+            print(yaml.dump(self._data))
+        elif self._args.output == 'cli':
+            self._output_cli(results)
+        elif self._args.output == 'ndjson':
+            for realm, _ in self._realms:
+                main, error = results[realm]
+                if main is None:
+                    self._emit('error', realm=realm, error=error)
+                else:
+                    main._emit('meta', **main._data['meta'])
+            self._emit('batch', **self._data['meta'])
+
+        if any(main is None for main, _ in results.values()):
+            exit(1)
+
+    def _output_cli(self, results):
+        for realm, _ in self._realms:
+            main, error = results[realm]
+            print("Realm {0}:".format(realm))
+            if main is None:
+                print("failed ({0})".format(error))
+                print("")
+                continue
+            main._output_cli()
+
+        meta = self._data['meta']
+        print("{0} realms checked in {1}s, at most {2} of {3} LDAP connections in use".format(
+            len(self._realms), meta['wall'], meta['connections']['peak'], meta['connections']['limit']))
+
 
 def main():
     try:
-        Main().run()
+        if len(sys.argv) > 1 and sys.argv[1] == 'diff':
+            Diff().run()
+        elif len(sys.argv) > 1 and sys.argv[1] == 'serve':
+            Daemon(sys.argv[2:]).run()
+        elif len(sys.argv) > 1 and sys.argv[1] == 'batch':
+            Batch(sys.argv[2:]).run()
+        else:
+            Main().run()
     except KeyboardInterrupt:
         print('\nTerminating...')
         exit(130)
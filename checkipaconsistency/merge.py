@@ -0,0 +1,99 @@
+#  -*- coding: utf-8 -*-
+"""
+Sorted merge module
+
+This file is part of checkipaconsistency.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import heapq
+import tempfile
+
+
+class ExternalSorter(object):
+    def __init__(self, chunk_size=100000):
+        self._chunk_size = chunk_size
+        self._chunk = list()
+        self._runs = list()
+
+    def add(self, value):
+        self._chunk.append(value)
+        if len(self._chunk) >= self._chunk_size:
+            self._spill()
+
+    def _spill(self):
+        self._chunk.sort()
+        # Runs are written as UTF-8 bytes, which works with the file objects
+        # of both Python 2 and 3.
+        run = tempfile.TemporaryFile()
+        for value in self._chunk:
+            run.write(value.encode('utf-8'))
+            run.write(b'\n')
+        run.seek(0)
+        self._runs.append(run)
+        self._chunk = list()
+
+    @staticmethod
+    def _read(run):
+        for line in run:
+            yield line[:-1].decode('utf-8')
+        run.close()
+
+    def __iter__(self):
+        self._chunk.sort()
+        iterables = [self._read(run) for run in self._runs]
+        iterables.append(iter(self._chunk))
+        self._runs = list()
+        previous = None
+        for value in heapq.merge(*iterables):
+            if value != previous:
+                yield value
+            previous = value
+
+
+def _tag(stream, server):
+    for value in stream:
+        yield value, server
+
+
+def iter_missing(streams):
+    current = None
+    present = set()
+
+    for value, server in heapq.merge(*[_tag(stream, server) for server, stream in streams.items()]):
+        if value != current:
+            if current is not None:
+                for _server in streams:
+                    if _server not in present:
+                        yield _server, current
+            current = value
+            present = set()
+        present.add(server)
+
+    if current is not None:
+        for _server in streams:
+            if _server not in present:
+                yield _server, current
+
+
+def missing(streams):
+    r = dict()
+    for server in streams:
+        r[server] = list()
+
+    for server, value in iter_missing(streams):
+        r[server].append(value)
+
+    return r
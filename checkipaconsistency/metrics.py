@@ -0,0 +1,123 @@
+#  -*- coding: utf-8 -*-
+"""
+Prometheus metrics module
+
+This file is part of checkipaconsistency.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _sample(name, labels, value):
+    if not labels:
+        return '{0} {1}'.format(name, value)
+    label_text = ','.join('{0}="{1}"'.format(key, _escape(labels[key])) for key in sorted(labels))
+    return '{0}{{{1}}} {2}'.format(name, label_text, value)
+
+
+def prometheus(data):
+    metrics = {
+        'cipa_check_result': [
+            'gauge', 'Numeric result of a check on a server', []
+        ],
+        'cipa_check_status': [
+            'gauge', 'Whether a check passed (1) or failed (0)', []
+        ],
+        'cipa_missing_dn': [
+            'gauge', 'Number of DNs missing on a server', []
+        ],
+        'cipa_anonymous_bind': [
+            'gauge', 'Anonymous bind setting of a server', []
+        ],
+        'cipa_replication_status': [
+            'gauge', 'Last update status code of a replication agreement', []
+        ],
+        'cipa_check_last_run_timestamp_seconds': [
+            'gauge', 'Time the check last ran', []
+        ],
+        'cipa_replication_lag_seconds': [
+            'gauge', 'Age of the newest change a supplier has that a consumer has not seen', []
+        ],
+        'cipa_run_failures_total': [
+            'counter', 'Number of runs that failed and left the previous results in place', []
+        ],
+        'cipa_last_success_timestamp_seconds': [
+            'gauge', 'Time the last run succeeded', []
+        ]
+    }
+
+    for check, payload in data.get('checks', dict()).items():
+        for status in ['item_count', 'missing_dn', 'duplicates']:
+            value = payload.get('status_{0}'.format(status))
+            if value is not None:
+                metrics['cipa_check_status'][2].append(
+                    _sample('cipa_check_status', {'check': check, 'status': status}, int(bool(value)))
+                )
+
+        for server, server_payload in payload['servers'].items():
+            result = server_payload['result']
+            labels = {'check': check, 'server': server}
+            if check == 'bind':
+                metrics['cipa_anonymous_bind'][2].append(
+                    _sample('cipa_anonymous_bind', {'server': server, 'state': result}, 1)
+                )
+            elif check == 'replicas':
+                for line in str(result).splitlines():
+                    replica, _, state = line.rpartition(' ')
+                    if state.isdigit():
+                        metrics['cipa_replication_status'][2].append(
+                            _sample('cipa_replication_status', {'server': server, 'replica': replica}, state)
+                        )
+            elif isinstance(result, (bool, int, float)):
+                metrics['cipa_check_result'][2].append(_sample('cipa_check_result', labels, int(result)))
+
+            if 'missing_dn' in server_payload:
+                metrics['cipa_missing_dn'][2].append(
+                    _sample('cipa_missing_dn', labels, len(server_payload['missing_dn']))
+                )
+
+    for check, timestamp in data.get('meta', dict()).get('last_run', dict()).items():
+        metrics['cipa_check_last_run_timestamp_seconds'][2].append(
+            _sample('cipa_check_last_run_timestamp_seconds', {'check': check}, '{0:.3f}'.format(timestamp))
+        )
+
+    meta = data.get('meta', dict())
+    if 'failures' in meta:
+        metrics['cipa_run_failures_total'][2].append(_sample('cipa_run_failures_total', dict(), meta['failures']))
+    if meta.get('last_success') is not None:
+        metrics['cipa_last_success_timestamp_seconds'][2].append(
+            _sample('cipa_last_success_timestamp_seconds', dict(), '{0:.3f}'.format(meta['last_success']))
+        )
+
+    lag = data.get('meta', dict()).get('lag', dict())
+    for supplier, consumers in lag.get('matrix', dict()).items():
+        for consumer, seconds in consumers.items():
+            metrics['cipa_replication_lag_seconds'][2].append(
+                _sample('cipa_replication_lag_seconds', {'supplier': supplier, 'consumer': consumer}, seconds)
+            )
+
+    lines = list()
+    for name in sorted(metrics):
+        metric_type, metric_help, samples = metrics[name]
+        if not samples:
+            continue
+        lines.append('# HELP {0} {1}'.format(name, metric_help))
+        lines.append('# TYPE {0} {1}'.format(name, metric_type))
+        lines.extend(sorted(samples))
+
+    return '\n'.join(lines) + '\n'
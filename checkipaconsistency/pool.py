@@ -0,0 +1,187 @@
+#  -*- coding: utf-8 -*-
+"""
+LDAP connection pool module
+
+This file is part of checkipaconsistency.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import ldap
+
+DOWN = (ldap.SERVER_DOWN, ldap.CONNECT_ERROR)
+
+_tls_lock = threading.Lock()
+_tls_configured = False
+
+
+def _configure_tls():
+    # All connections share libldap's global TLS context, which is what lets
+    # reconnects resume the previous TLS session where the library supports it.
+    global _tls_configured
+    with _tls_lock:
+        if not _tls_configured:
+            ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
+            _tls_configured = True
+
+
+class ConnectionPool(object):
+    def __init__(self, url, binddn, bindpw, size=1, timeout=3, idle=60, retries=1, limiter=None):
+        self._url = url
+        self._binddn = binddn
+        self._bindpw = bindpw
+        self._size = size
+        self._timeout = timeout
+        self._idle = idle
+        self._retries = retries
+        self._limiter = limiter
+
+        self._lock = threading.Condition()
+        self._free = list()
+        self._broken = set()
+        self._created = 0
+
+        self.reconnects = 0
+
+        if limiter is not None:
+            limiter.register(self)
+
+    def _connect(self):
+        _configure_tls()
+        conn = ldap.initialize(self._url)
+        conn.set_option(ldap.OPT_NETWORK_TIMEOUT, self._timeout)
+        conn.set_option(ldap.OPT_REFERRALS, ldap.OPT_OFF)
+        if self._idle:
+            for option, value in [
+                ('OPT_X_KEEPALIVE_IDLE', self._idle),
+                ('OPT_X_KEEPALIVE_INTERVAL', max(1, self._idle // 4)),
+                ('OPT_X_KEEPALIVE_PROBES', 3)
+            ]:
+                if hasattr(ldap, option):
+                    conn.set_option(getattr(ldap, option), value)
+        conn.simple_bind_s(self._binddn, self._bindpw)
+        return conn
+
+    def _open(self):
+        # With a limiter, a connection holds one of its slots until closed.
+        if self._limiter is None:
+            return self._connect()
+        self._limiter.acquire()
+        try:
+            return self._connect()
+        except Exception:
+            self._limiter.release()
+            raise
+
+    def connect(self):
+        conn = self._open()
+        with self._lock:
+            self._created += 1
+            self._free.append((conn, time.time()))
+
+    def _checkout(self):
+        with self._lock:
+            while not self._free and self._created >= self._size:
+                self._lock.wait()
+            if self._free:
+                conn, last_used = self._free.pop()
+            else:
+                conn, last_used = None, None
+                self._created += 1
+
+        try:
+            if conn is not None and self._idle and time.time() - last_used > self._idle:
+                try:
+                    conn.whoami_s()
+                except DOWN:
+                    self._close(conn)
+                    conn = None
+            if conn is None:
+                conn = self._open()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+                self._lock.notify()
+            raise
+
+        return conn
+
+    def _checkin(self, conn):
+        with self._lock:
+            if conn in self._broken:
+                self._broken.discard(conn)
+                self._created -= 1
+                self._close(conn)
+            else:
+                self._free.append((conn, time.time()))
+            self._lock.notify()
+        if self._limiter is not None:
+            self._limiter.notify()
+
+    def _close(self, conn):
+        try:
+            conn.unbind_s()
+        except ldap.LDAPError:
+            pass
+        if self._limiter is not None:
+            self._limiter.release()
+
+    def close_idle(self):
+        # Closes the least recently used idle connection, if there is one.
+        with self._lock:
+            if not self._free:
+                return False
+            conn, _ = self._free.pop(0)
+            self._created -= 1
+            self._lock.notify()
+        self._close(conn)
+        return True
+
+    def discard(self, conn):
+        with self._lock:
+            self._broken.add(conn)
+            self.reconnects += 1
+
+    @contextmanager
+    def connection(self):
+        conn = self._checkout()
+        try:
+            yield conn
+        except DOWN:
+            self.discard(conn)
+            raise
+        finally:
+            self._checkin(conn)
+
+    def run(self, fn):
+        attempt = 0
+        while True:
+            try:
+                with self.connection() as conn:
+                    return fn(conn)
+            except DOWN:
+                if attempt >= self._retries:
+                    raise
+                attempt += 1
+
+    def close(self):
+        with self._lock:
+            while self._free:
+                conn, _ = self._free.pop()
+                self._created -= 1
+                self._close(conn)
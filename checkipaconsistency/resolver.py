@@ -0,0 +1,173 @@
+#  -*- coding: utf-8 -*-
+"""
+Caching DNS resolver module
+
+This file is part of checkipaconsistency.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+NEGATIVE_TTL = 60
+
+_ERRORS = ['NXDOMAIN', 'NoAnswer', 'NoNameservers', 'Timeout']
+
+
+class ResolveError(Exception):
+    pass
+
+
+class Resolver(object):
+    def __init__(self, timeout=None, cache_file=None, negative_ttl=NEGATIVE_TTL):
+        self._timeout = timeout
+        self._cache_file = cache_file
+        self._negative_ttl = negative_ttl
+        self._resolver = None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._inflight = dict()
+        self._cache = self._load()
+
+        self.lookups = 0
+        self.hits = 0
+
+    def _get_resolver(self):
+        if self._resolver is None:
+            # dnspython is slow to import and most runs never resolve anything.
+            import dns.resolver
+            resolver = dns.resolver.Resolver()
+            if self._timeout:
+                resolver.timeout = self._timeout
+                resolver.lifetime = self._timeout
+            self._resolver = resolver
+        return self._resolver
+
+    def _load(self):
+        if not self._cache_file or not os.path.isfile(self._cache_file):
+            return dict()
+
+        try:
+            with open(self._cache_file) as f:
+                return json.load(f)
+        except ValueError:
+            return dict()
+
+    def _save(self):
+        if not self._cache_file:
+            return
+
+        # Lookups finishing on several threads save in turn through the one
+        # temporary file. The cache only saves lookups, so failing to write it
+        # is not an error.
+        with self._save_lock:
+            now = time.time()
+            with self._lock:
+                cache = dict((key, value) for key, value in self._cache.items() if value['expires'] > now)
+            tmp_path = '{0}.{1}.tmp'.format(self._cache_file, os.getpid())
+            try:
+                directory = os.path.dirname(self._cache_file)
+                if directory and not os.path.exists(directory):
+                    os.makedirs(directory)
+                with open(tmp_path, 'w') as f:
+                    json.dump(cache, f)
+                os.rename(tmp_path, self._cache_file)
+            except (IOError, OSError):
+                pass
+
+    def resolve(self, name, rdtype='SRV'):
+        key = '{0} {1}'.format(name.lower(), rdtype)
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached['expires'] > time.time():
+                self.hits += 1
+                return self._answer(cached)
+            event = self._inflight.get(key)
+            if event is None:
+                event = self._inflight[key] = threading.Event()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            event.wait()
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self.hits += 1
+            if cached is None:
+                return self.resolve(name, rdtype)
+            return self._answer(cached)
+
+        try:
+            entry = self._lookup(name, rdtype)
+            with self._lock:
+                self._cache[key] = entry
+            self._save()
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+        return self._answer(entry)
+
+    def _lookup(self, name, rdtype):
+        with self._lock:
+            self.lookups += 1
+        resolver = self._get_resolver()
+
+        import dns.exception
+        import dns.resolver
+        failures = (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer, dns.resolver.NoNameservers, dns.exception.Timeout)
+
+        try:
+            answers = resolver.resolve(name, rdtype)
+        except failures as e:
+            return {
+                'expires': time.time() + self._negative_ttl,
+                'error': type(e).__name__ if type(e).__name__ in _ERRORS else 'Timeout'
+            }
+
+        return {
+            'expires': time.time() + answers.rrset.ttl,
+            'answers': [answer.to_text() for answer in answers]
+        }
+
+    @staticmethod
+    def _answer(entry):
+        if 'error' in entry:
+            raise ResolveError(entry['error'])
+        return list(entry['answers'])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'lookups': self.lookups,
+                'hits': self.hits
+            }
+
+    def prefetch(self, names, rdtype='SRV'):
+        def lookup(name):
+            try:
+                self.resolve(name, rdtype)
+            except ResolveError:
+                pass
+
+        with ThreadPoolExecutor(max_workers=max(1, len(names))) as executor:
+            list(executor.map(lookup, names))
@@ -0,0 +1,96 @@
+#  -*- coding: utf-8 -*-
+"""
+Replica update vector module
+
+This file is part of checkipaconsistency.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import re
+
+_ELEMENT = re.compile(r'\{replica (\d+)(?: ([^}]*))?\}\s*(\S+)?\s*(\S+)?')
+_GENERATION = re.compile(r'\{replicageneration\}\s*(\S+)')
+
+
+def parse_ruv(values):
+    ruv = {
+        'generation': None,
+        'replicas': dict()
+    }
+
+    for value in values:
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        match = _GENERATION.search(value)
+        if match:
+            ruv['generation'] = match.group(1)
+            continue
+        match = _ELEMENT.search(value)
+        if match:
+            ruv['replicas'][match.group(1)] = {
+                'url': match.group(2),
+                'min_csn': match.group(3),
+                'max_csn': match.group(4)
+            }
+
+    return ruv
+
+
+def max_csns(ruv):
+    return dict((rid, element['max_csn']) for rid, element in ruv['replicas'].items() if element['max_csn'])
+
+
+def in_sync(ruvs):
+    if not ruvs or any(not ruv for ruv in ruvs):
+        return False
+
+    generations = set(ruv['generation'] for ruv in ruvs)
+    if len(generations) != 1:
+        return False
+
+    first = max_csns(ruvs[0])
+    return all(max_csns(ruv) == first for ruv in ruvs[1:])
+
+
+def csn_time(csn):
+    # A CSN is 8 hex digits of seconds since the epoch followed by a
+    # sequence number, the replica ID and a sub-sequence number.
+    if not csn:
+        return None
+    return int(csn[:8], 16)
+
+
+def lag_matrix(ruvs):
+    matrix = dict()
+    for supplier, supplier_ruv in ruvs.items():
+        if not supplier_ruv:
+            continue
+        matrix[supplier] = dict()
+        for consumer, consumer_ruv in ruvs.items():
+            if consumer == supplier or not consumer_ruv:
+                continue
+            lag = 0
+            for rid, element in supplier_ruv['replicas'].items():
+                newest = csn_time(element['max_csn'])
+                if newest is None:
+                    continue
+                seen = consumer_ruv['replicas'].get(rid, dict()).get('max_csn')
+                if seen:
+                    seen = csn_time(seen)
+                else:
+                    seen = csn_time(element['min_csn'])
+                lag = max(lag, newest - seen)
+            matrix[supplier][consumer] = lag
+    return matrix
@@ -0,0 +1,119 @@
+#  -*- coding: utf-8 -*-
+"""
+Batch scheduler module
+
+This file is part of checkipaconsistency.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Limiter(object):
+    def __init__(self, scheduler, connections):
+        self._scheduler = scheduler
+        self._pools = list()
+        self.limit = connections
+        self.active = 0
+        self.peak = 0
+
+    def register(self, pool):
+        with self._scheduler.condition:
+            self._pools.append(pool)
+
+    def _take(self):
+        scheduler = self._scheduler
+        if self.active >= self.limit or scheduler.active >= scheduler.limit:
+            return False
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        scheduler.active += 1
+        scheduler.peak = max(scheduler.peak, scheduler.active)
+        return True
+
+    def _close_idle(self):
+        with self._scheduler.condition:
+            pools = list(self._pools)
+        for pool in pools:
+            if pool.close_idle():
+                return True
+        return False
+
+    def acquire(self):
+        # Every open connection holds a slot of its realm and one of the
+        # global limit until it is closed, pooled or not. While none is free,
+        # the realm's own idle connections are closed to make room, so a realm
+        # never waits on slots that only it could give back.
+        condition = self._scheduler.condition
+        while True:
+            with condition:
+                if self._take():
+                    return
+            if self._close_idle():
+                continue
+            with condition:
+                if self._take():
+                    return
+                condition.wait()
+
+    def release(self):
+        with self._scheduler.condition:
+            self.active -= 1
+            self._scheduler.active -= 1
+            self._scheduler.condition.notify_all()
+
+    def close(self):
+        # Closes the realm's pooled connections once it is done, which gives
+        # their slots back to the other realms.
+        with self._scheduler.condition:
+            pools = list(self._pools)
+        for pool in pools:
+            pool.close()
+
+    def notify(self):
+        # Wakes up waiting realms when a connection went back to its pool,
+        # since it can now be closed to free its slot.
+        with self._scheduler.condition:
+            self._scheduler.condition.notify_all()
+
+
+class Scheduler(object):
+    def __init__(self, connections, stagger=0.0):
+        self.condition = threading.Condition()
+        self._stagger = stagger
+        self.limit = connections
+        self.active = 0
+        self.peak = 0
+        self.limiters = dict()
+        self.started = dict()
+
+    def run(self, jobs):
+        # jobs is a list of (name, connections, fn) tuples; fn is called with
+        # the job's Limiter once its start time, spread by the stagger, is up.
+        start = time.time()
+
+        def job(index, name, fn):
+            time.sleep(max(0, start + index * self._stagger - time.time()))
+            self.started[name] = round(time.time() - start, 3)
+            return fn(self.limiters[name])
+
+        with ThreadPoolExecutor(max_workers=max(1, len(jobs))) as executor:
+            futures = list()
+            for index, (name, connections, fn) in enumerate(jobs):
+                self.limiters[name] = Limiter(self, connections)
+                futures.append((name, executor.submit(job, index, name, fn)))
+            return dict((name, future.result()) for name, future in futures)
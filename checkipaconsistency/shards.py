@@ -0,0 +1,76 @@
+#  -*- coding: utf-8 -*-
+"""
+Search sharding module
+
+This file is part of checkipaconsistency.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from .certs import encode_serial, split
+
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789'
+
+ATTRIBUTES = {
+    'users': 'uid',
+    'susers': 'uid',
+    'pusers': 'uid',
+    'hosts': 'fqdn',
+    'services': 'krbprincipalname'
+}
+
+
+def _prefixes(attr, chars):
+    return ''.join('({0}={1}*)'.format(attr, char) for char in chars)
+
+
+def prefix_filters(attr, shards):
+    # Shards by the first character of attr in contiguous runs of the
+    # alphabet.  The last shard also takes every value starting with any other
+    # character, and entries without the attribute at all.
+    step = -(-len(ALPHABET) // max(1, min(shards, len(ALPHABET))))
+    groups = [ALPHABET[i:i + step] for i in range(0, len(ALPHABET), step)]
+    filters = ['(|{0})'.format(_prefixes(attr, chars)) for chars in groups]
+    filters[-1] = '(|{0}(!(|{1})))'.format(_prefixes(attr, groups[-1]), _prefixes(attr, ALPHABET))
+    return filters
+
+
+def serial_filters(highest, shards):
+    # The last shard is left open so certificates issued since the highest
+    # serial was read still fall into one of them.
+    filters = list()
+    ranges = split(0, highest + 1, max(1, shards))
+    for i, (low, high) in enumerate(ranges):
+        fltr = ''
+        if low:
+            fltr += '(serialno>={0})'.format(encode_serial(low))
+        if i < len(ranges) - 1:
+            fltr += '(!(serialno>={0}))'.format(encode_serial(high))
+        filters.append('(&{0})'.format(fltr) if fltr else '(serialno=*)')
+    return filters
+
+
+def merge(shards):
+    # Returns the entries of all shards, or None unless every entry was
+    # returned by exactly one shard.
+    seen = set()
+    results = list()
+    for shard in shards:
+        for dn, attrs in shard:
+            key = dn.lower()
+            if key in seen:
+                return None
+            seen.add(key)
+            results.append((dn, attrs))
+    return results
@@ -0,0 +1,53 @@
+#  -*- coding: utf-8 -*-
+"""
+Snapshot store module
+
+This file is part of checkipaconsistency.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import os
+
+
+class SnapshotStore(object):
+    def __init__(self, directory):
+        self._directory = directory
+
+        if not os.path.exists(self._directory):
+            os.makedirs(self._directory)
+
+    def _path(self, server, check):
+        return os.path.join(self._directory, '{0}.{1}.json'.format(server, check))
+
+    def load(self, server, check):
+        path = self._path(server, check)
+
+        if not os.path.isfile(path):
+            return dict()
+
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except ValueError:
+            return dict()
+
+    def save(self, server, check, snapshot):
+        path = self._path(server, check)
+        tmp_path = path + '.tmp'
+
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.rename(tmp_path, path)
@@ -0,0 +1,195 @@
+#  -*- coding: utf-8 -*-
+"""
+SQLite run store module
+
+This file is part of checkipaconsistency.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started TEXT NOT NULL,
+    domain TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_checks (
+    run_id INTEGER NOT NULL,
+    check_name TEXT NOT NULL,
+    PRIMARY KEY (run_id, check_name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL,
+    check_name TEXT NOT NULL,
+    server TEXT NOT NULL,
+    result TEXT,
+    PRIMARY KEY (run_id, check_name, server)
+);
+CREATE TABLE IF NOT EXISTS statuses (
+    run_id INTEGER NOT NULL,
+    check_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    ok INTEGER NOT NULL,
+    PRIMARY KEY (run_id, check_name, status)
+);
+CREATE TABLE IF NOT EXISTS entries (
+    run_id INTEGER NOT NULL,
+    check_name TEXT NOT NULL,
+    server TEXT NOT NULL,
+    dn TEXT NOT NULL,
+    cn TEXT,
+    unique_id TEXT,
+    PRIMARY KEY (run_id, check_name, server, dn)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS missing_dn (
+    run_id INTEGER NOT NULL,
+    check_name TEXT NOT NULL,
+    server TEXT NOT NULL,
+    dn TEXT NOT NULL,
+    PRIMARY KEY (run_id, check_name, server, dn)
+) WITHOUT ROWID;
+'''
+
+
+class Store(object):
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def save_run(self, domain, data, entries, checks=None):
+        # checks are the ones the run actually ran; the summaries of the others
+        # in data are carried over from earlier runs.
+        if checks is None:
+            checks = list(data['checks'])
+
+        with self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO runs (started, domain) VALUES (?, ?)',
+                (datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'), domain)
+            )
+            run_id = cursor.lastrowid
+            self._conn.executemany('INSERT INTO run_checks VALUES (?, ?)', [(run_id, check) for check in checks])
+
+            for check, payload in data['checks'].items():
+                self._conn.executemany(
+                    'INSERT INTO results VALUES (?, ?, ?, ?)',
+                    [(run_id, check, server, json.dumps(server_payload['result']))
+                     for server, server_payload in payload['servers'].items()]
+                )
+                self._conn.executemany(
+                    'INSERT INTO statuses VALUES (?, ?, ?, ?)',
+                    [(run_id, check, status, int(bool(payload[status])))
+                     for status in ['status_item_count', 'status_missing_dn', 'status_duplicates']
+                     if payload.get(status) is not None]
+                )
+                for server, server_payload in payload['servers'].items():
+                    self._conn.executemany(
+                        'INSERT OR IGNORE INTO missing_dn VALUES (?, ?, ?, ?)',
+                        [(run_id, check, server, dn) for dn in server_payload.get('missing_dn', [])]
+                    )
+
+            for (check, server), check_entries in entries.items():
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                    [(run_id, check, server, entry.dn, entry.cn, entry.unique_id) for entry in check_entries]
+                )
+
+        return run_id
+
+    def runs(self):
+        return self._conn.execute('SELECT id, started, domain FROM runs ORDER BY id').fetchall()
+
+    def run_domain(self, run_id):
+        row = self._conn.execute('SELECT domain FROM runs WHERE id = ?', (run_id,)).fetchone()
+        return row[0] if row else None
+
+    def last_run(self, domain=None):
+        if domain is None:
+            row = self._conn.execute('SELECT MAX(id) FROM runs').fetchone()
+        else:
+            row = self._conn.execute('SELECT MAX(id) FROM runs WHERE domain = ?', (domain,)).fetchone()
+        return row[0]
+
+    def _checks(self, run_id):
+        rows = self._conn.execute('SELECT check_name FROM run_checks WHERE run_id = ?', (run_id,)).fetchall()
+        if not rows:
+            # Runs stored before coverage was recorded ran every check they hold.
+            rows = self._conn.execute('SELECT DISTINCT check_name FROM results WHERE run_id = ?', (run_id,))
+        return set(row[0] for row in rows)
+
+    def _delta(self, table, since, until):
+        query = '''
+            SELECT b.check_name, b.server, b.dn FROM {0} b
+            WHERE b.run_id = ? AND NOT EXISTS (
+                SELECT 1 FROM {0} a
+                WHERE a.run_id = ? AND a.check_name = b.check_name AND a.server = b.server AND a.dn = b.dn
+            )
+        '''.format(table)
+        return self._conn.execute(query, (until, since))
+
+    def diff(self, since, until):
+        # Only checks both runs ran are compared, so a daemon run that only
+        # refreshed some checks does not report the others as removed.
+        checks = self._checks(since) & self._checks(until)
+        r = dict()
+
+        def server_diff(check, server):
+            checks = r.setdefault(check, dict())
+            servers = checks.setdefault('servers', dict())
+            return servers.setdefault(server, dict())
+
+        rows = self._conn.execute('''
+            SELECT a.check_name, a.server, a.result, b.result FROM results a
+            JOIN results b ON b.run_id = ? AND b.check_name = a.check_name AND b.server = a.server
+            WHERE a.run_id = ? AND a.result != b.result
+        ''', (until, since))
+        for check, server, old, new in rows:
+            if check not in checks:
+                continue
+            server_diff(check, server)['result'] = [json.loads(old), json.loads(new)]
+
+        rows = self._conn.execute('''
+            SELECT a.check_name, a.status, a.ok, b.ok FROM statuses a
+            JOIN statuses b ON b.run_id = ? AND b.check_name = a.check_name AND b.status = a.status
+            WHERE a.run_id = ? AND a.ok != b.ok
+        ''', (until, since))
+        for check, status, old, new in rows:
+            if check not in checks:
+                continue
+            r.setdefault(check, dict()).setdefault('status', dict())[status] = [bool(old), bool(new)]
+
+        for key, table, a, b in [
+            ('added', 'entries', since, until),
+            ('removed', 'entries', until, since),
+            ('missing_dn_new', 'missing_dn', since, until),
+            ('missing_dn_resolved', 'missing_dn', until, since)
+        ]:
+            for check, server, dn in self._delta(table, a, b):
+                if check not in checks:
+                    continue
+                server_diff(check, server).setdefault(key, list()).append(dn)
+
+        return r
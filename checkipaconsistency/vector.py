@@ -0,0 +1,119 @@
+#  -*- coding: utf-8 -*-
+"""
+Missing DN comparison module
+
+This file is part of checkipaconsistency.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from operator import attrgetter
+
+numpy = None
+_numpy_loaded = False
+
+THRESHOLD = 200000
+
+_dn = attrgetter('dn')
+
+
+class HashCollision(Exception):
+    pass
+
+
+def load_numpy():
+    # NumPy takes longer to import than most checks take to compare, so it is
+    # only imported once a check is large enough to be vectorised.
+    global numpy, _numpy_loaded
+    if not _numpy_loaded:
+        try:
+            import numpy as module
+            numpy = module
+        except ImportError:
+            pass
+        _numpy_loaded = True
+    return numpy
+
+
+def set_missing(servers):
+    all_dns = set()
+    server_dns = dict()
+    for server, entries in servers.items():
+        items = set()
+        for entry in entries:
+            items.add(entry.dn)
+        all_dns.update(items)
+        server_dns[server] = items
+
+    missing_dn = dict()
+    for server, items in server_dns.items():
+        missing_dn[server] = list(all_dns.difference(items))
+    return missing_dn
+
+
+def _hashes(entries):
+    # DNs are interned, so hash() is computed once per DN and cached.
+    values = numpy.fromiter(map(hash, map(_dn, entries)), dtype=numpy.int64, count=len(entries))
+    values = values.view(numpy.uint64)
+    order = numpy.argsort(values)
+    values = values[order]
+    if len(values) > 1 and numpy.any(values[1:] == values[:-1]):
+        raise HashCollision()
+    return values, order
+
+
+def _lookup(values, wanted):
+    index = numpy.searchsorted(values, wanted)
+    index[index == len(values)] = 0
+    if not len(values):
+        return index, numpy.zeros(len(wanted), dtype=bool)
+    return index, values[index] == wanted
+
+
+def vector_missing(servers):
+    load_numpy()
+    hashes = dict((server, _hashes(entries)) for server, entries in servers.items())
+
+    # Hashes held by every server cannot be missing anywhere; only the rest
+    # are looked up per server and mapped back to DNs.
+    all_hashes, counts = numpy.unique(
+        numpy.concatenate([values for values, _ in hashes.values()]),
+        return_counts=True
+    )
+    wanted = all_hashes[counts < len(servers)]
+
+    names = dict()
+    deltas = dict()
+    for server, (values, order) in hashes.items():
+        index, found = _lookup(values, wanted)
+        deltas[server] = wanted[~found]
+        entries = servers[server]
+        for value, position in zip(wanted[found].tolist(), order[index[found]].tolist()):
+            dn = entries[position].dn
+            if names.setdefault(value, dn) != dn:
+                raise HashCollision()
+
+    missing_dn = dict()
+    for server, delta in deltas.items():
+        missing_dn[server] = [names[value] for value in delta.tolist()]
+    return missing_dn
+
+
+def missing_dns(servers, threshold=THRESHOLD):
+    if threshold and sum(len(entries) for entries in servers.values()) >= threshold and load_numpy() is not None:
+        try:
+            return vector_missing(servers)
+        except HashCollision:
+            pass
+    return set_missing(servers)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The tests run the real FreeIPAServer against the benchmarks' in-process
+# LDAP stand-in and synthetic directories.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'benchmarks'))
@@ -0,0 +1,22 @@
+import dns.resolver
+
+from checkipaconsistency.resolver import Resolver
+
+
+class FakeDNS(object):
+    # Stands in for a dnspython resolver and answers every query with
+    # NXDOMAIN, so the tests never reach the network.
+    def __init__(self):
+        self.queries = list()
+
+    def resolve(self, name, rdtype):
+        self.queries.append((name, rdtype))
+        raise dns.resolver.NXDOMAIN()
+
+
+def install(test):
+    fake = FakeDNS()
+    get_resolver = Resolver._get_resolver
+    Resolver._get_resolver = lambda self: fake
+    test.addCleanup(setattr, Resolver, '_get_resolver', get_resolver)
+    return fake
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from directory import generate
+from fakeldap import install
+
+from checkipaconsistency.main import Batch
+from tests import fakedns
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.config = tempfile.mkdtemp()
+        self.environ = os.environ.get('XDG_CONFIG_HOME')
+        os.environ['XDG_CONFIG_HOME'] = self.config
+        fakedns.install(self)
+
+    def tearDown(self):
+        if self.environ is None:
+            del os.environ['XDG_CONFIG_HOME']
+        else:
+            os.environ['XDG_CONFIG_HOME'] = self.environ
+        shutil.rmtree(self.config)
+
+    def test_limits_count_open_connections(self):
+        # Three servers per realm and two slots each: a realm has to close
+        # its idle connections to reach its last server.
+        directories = list()
+        sections = list()
+        for i in range(3):
+            domain = 'realm{0}.example.com'.format(i)
+            realm, _ = generate(replicas=3, users=100, missing=0, duplicates=0, domain=domain, seed=i)
+            directories += realm
+            sections.append('[IPA:r{0}]\nDOMAIN = {1}\nHOSTS = {2}\nBINDPW = test\n'.format(
+                i, domain, ', '.join(directory.host for directory in realm)))
+        with open(os.path.join(self.config, 'checkipaconsistency'), 'w') as f:
+            f.write('\n'.join(sections))
+
+        with install(directories) as network:
+            batch = Batch(['--max-connections', '3', '--realm-connections', '2', '--stagger', '0',
+                           '--pool-size', '2'])
+            try:
+                batch.run()
+            except SystemExit as e:
+                self.assertEqual(e.code, 0)
+
+        for realm in batch._data['realms'].values():
+            self.assertNotIn('error', realm)
+        self.assertLessEqual(network.peak_open, 3)
+        self.assertEqual(batch._data['meta']['connections']['peak'], network.peak_open)
+        self.assertEqual(network.open, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+import ldap
+from directory import generate
+from fakeldap import install
+
+from tests.test_fast_count import run
+
+
+def unreachable(fn):
+    raise ldap.CONNECT_ERROR({'desc': 'Connect error'})
+
+
+class ConnectErrorTest(unittest.TestCase):
+    def test_connect_error_is_a_failed_search(self):
+        # The pool re-raises CONNECT_ERROR like SERVER_DOWN once its retries
+        # are used up.
+        directories, _ = generate(replicas=2, users=100, missing=0, duplicates=0)
+
+        with install(directories):
+            main = run(directories, 'users')
+            payload = list(main._servers.values())[0]
+            payload._pool.run = unreachable
+            payload.invalidate()
+
+            self.assertIs(payload.users, False)
+            self.assertIs(payload.digest('users'), False)
+            self.assertIs(payload.stream('users', lambda entry: None), False)
+            main._close()
+
+
+if __name__ == '__main__':
+    unittest.main()
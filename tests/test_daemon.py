@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from directory import DOMAIN, generate
+from fakeldap import install
+
+from checkipaconsistency.main import Daemon
+from checkipaconsistency.metrics import prometheus
+from checkipaconsistency.store import Store
+from tests import fakedns
+
+
+def daemon_argv(directories, *args):
+    argv = ['-d', DOMAIN, '-D', 'cn=Directory Manager', '-W', 'test'] + list(args)
+    return argv + ['-H'] + [directory.host for directory in directories]
+
+
+def advance_ruv(directory):
+    # Moves the newest change of every replica in the directory's RUV about
+    # twelve days ahead of the other directories.
+    dn, attrs = directory.entries['nsuniqueid=ffffffff-ffffffff-ffffffff-ffffffff,' + directory.base_dn]
+    attrs['nsds50ruv'] = [value.replace(b' 5f10', b' 5f20') for value in attrs['nsds50ruv']]
+
+
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        fakedns.install(self)
+
+    def test_server_going_down_keeps_the_last_good_results(self):
+        directories, _ = generate(replicas=2, users=100, missing=0, duplicates=0)
+
+        with install(directories):
+            daemon = Daemon(daemon_argv(directories))
+            checks = list(daemon._all_checks)
+            daemon._run_cycle(checks)
+            good = daemon._published
+            self.assertEqual(good['meta']['failures'], 0)
+
+            directories[1].down = True
+            daemon._run_cycle(checks)
+            daemon._close()
+
+        published = daemon._published
+        self.assertEqual(published['meta']['failures'], 1)
+        self.assertEqual(published['meta']['last_success'], good['meta']['last_success'])
+        self.assertEqual(published['checks'], good['checks'])
+
+        metrics = prometheus(published)
+        self.assertIn('cipa_run_failures_total 1\n', metrics)
+        self.assertIn('cipa_last_success_timestamp_seconds ', metrics)
+
+    def test_partial_runs_only_diff_the_checks_they_ran(self):
+        directories, _ = generate(replicas=2, users=100, missing=0, duplicates=0)
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'runs.db')
+
+        try:
+            with install(directories):
+                daemon = Daemon(daemon_argv(directories, '--store', path))
+                daemon._run_cycle(list(daemon._all_checks))
+                directories[0].remove('uid=user0000001,cn=users,cn=accounts,' + directories[0].base_dn)
+                daemon._run_cycle(['hosts'])
+                daemon._run_cycle(['users'])
+                daemon._close()
+
+            store = Store(path)
+            self.assertEqual(store.diff(1, 2), dict())
+            diff = store.diff(1, 3)
+            store.close()
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(list(diff), ['users'])
+        removed = [server_payload.get('removed') for server_payload in diff['users']['servers'].values()]
+        self.assertIn(['uid=user0000001,cn=users,cn=accounts,' + directories[0].base_dn.lower()], removed)
+
+    def test_diverged_ruvs_run_the_full_comparison(self):
+        directories, _ = generate(replicas=2, users=100, missing=0, duplicates=0)
+        user = 'uid=user0000001,cn=users,cn=accounts,' + directories[0].base_dn
+
+        with install(directories):
+            daemon = Daemon(daemon_argv(directories, '--ruv'))
+            daemon._run_cycle(['users'])
+            self.assertIn('users', daemon._counts)
+
+            directories[0].remove(user)
+            advance_ruv(directories[0])
+            daemon._run_cycle(['users'])
+            daemon._close()
+
+        self.assertNotIn('users', daemon._counts)
+        servers = daemon._published['checks']['users']['servers']
+        self.assertEqual(servers[directories[0].host]['missing_dn'], [user.lower()])
+
+    def test_lag_follows_the_ruvs(self):
+        directories, _ = generate(replicas=2, users=100, missing=0, duplicates=0)
+
+        with install(directories):
+            daemon = Daemon(daemon_argv(directories, '--lag'))
+            daemon._run_cycle(['replicas'])
+            self.assertEqual(daemon._published['meta']['lag']['max'], 0)
+
+            advance_ruv(directories[0])
+            daemon._run_cycle(['replicas'])
+            daemon._close()
+
+        self.assertEqual(daemon._published['meta']['lag']['max'], 0x5f200000 - 0x5f100000)
+        self.assertIn('cipa_replication_lag_seconds{{consumer="{0}",supplier="{1}"}} {2}'.format(
+            directories[1].host, directories[0].host, 0x5f200000 - 0x5f100000), prometheus(daemon._published))
+
+
+if __name__ == '__main__':
+    unittest.main()
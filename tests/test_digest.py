@@ -0,0 +1,53 @@
+import unittest
+
+from directory import generate
+from fakeldap import install
+
+from checkipaconsistency.digest import DigestTree, diverging_buckets
+from tests.test_fast_count import run
+
+
+def tree(entries):
+    r = DigestTree()
+    for dn, unique_id, timestamp in entries:
+        r.add(dn, {'ipaUniqueID': [unique_id], 'modifyTimestamp': [timestamp]})
+    return r
+
+
+ENTRIES = [('uid=user{0},cn=users,dc=example,dc=com'.format(i), 'id{0}'.format(i).encode('utf-8'),
+            b'20240101000000Z') for i in range(50)]
+
+
+class DigestTreeTest(unittest.TestCase):
+    def test_order_and_dn_case_do_not_matter(self):
+        same = [(dn.upper(), unique_id, timestamp) for dn, unique_id, timestamp in reversed(ENTRIES)]
+
+        self.assertEqual(tree(ENTRIES).root, tree(same).root)
+        self.assertEqual(diverging_buckets([tree(ENTRIES), tree(same)]), set())
+
+    def test_only_buckets_of_differing_entries_diverge(self):
+        changed = list(ENTRIES)
+        changed[3] = (changed[3][0], changed[3][1], b'20240102000000Z')
+        missing = ENTRIES[:10] + ENTRIES[11:]
+
+        self.assertEqual(diverging_buckets([tree(ENTRIES), tree(changed)]),
+                         set([DigestTree.bucket(ENTRIES[3][0])]))
+        self.assertEqual(diverging_buckets([tree(ENTRIES), tree(changed), tree(missing)]),
+                         set([DigestTree.bucket(ENTRIES[3][0]), DigestTree.bucket(ENTRIES[10][0])]))
+
+    def test_digest_finds_the_missing_entries(self):
+        directories, truth = generate(replicas=2, users=500, missing=0.01, duplicates=0)
+        self.assertTrue(truth.missing['users'])
+
+        with install(directories):
+            main = run(directories, 'users', '--digest')
+            main._close()
+
+        found = set()
+        for server in main._data['checks']['users']['servers'].values():
+            found.update(server['missing_dn'])
+        self.assertEqual(found, truth.missing['users'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import json
+import sys
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from directory import DOMAIN, generate
+from fakeldap import install
+
+from checkipaconsistency.main import Main
+from tests import fakedns
+
+
+class DNSTest(unittest.TestCase):
+    def test_msdcs_is_looked_up_once_per_run(self):
+        dns = fakedns.install(self)
+        directories, _ = generate(replicas=3, users=100, missing=0, duplicates=0)
+        argv = ['-d', DOMAIN, '-D', 'cn=Directory Manager', '-W', 'test', '--show-cache', '-o', 'json', '-H']
+        argv += [directory.host for directory in directories]
+
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            with install(directories):
+                Main(argv).run()
+            data = json.loads(sys.stdout.getvalue())
+        finally:
+            sys.stdout = stdout
+
+        # The first server looks the record up, the others are answered from
+        # the cache.
+        self.assertEqual(len(dns.queries), 1)
+        self.assertEqual(data['meta']['dns'], {'lookups': 1, 'hits': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import random
+import unittest
+
+from checkipaconsistency.duplicates import DuplicateIndex
+from checkipaconsistency.entry import Entry
+
+SERVERS = ['ipa01', 'ipa02', 'ipa03']
+
+
+def reference(entries, by_cn):
+    # The dict-of-sets bookkeeping DuplicateIndex replaced.
+    identifiers = dict()
+    for server, entry in entries:
+        identifier = entry.cn if by_cn else entry.dn
+        payload = identifiers.setdefault(identifier, {'identifiers': set(), 'servers': dict(), 'dn': dict()})
+        payload['identifiers'].add(entry.unique_id)
+        payload['servers'].setdefault(server, set()).add(entry.unique_id)
+        payload['dn'].setdefault(entry.dn, set()).add(entry.unique_id)
+    return dict((identifier, payload) for identifier, payload in identifiers.items()
+                if len(payload['identifiers']) > 1)
+
+
+def collisions(index):
+    return dict(index.collisions())
+
+
+def random_entries(rng):
+    entries = list()
+    for server in SERVERS:
+        for _ in range(rng.randint(0, 12)):
+            i = rng.randint(0, 5)
+            entries.append((server, Entry(
+                'cn=rule{0},cn=hbac,dc=example,dc=com'.format(rng.choice([i, i, i, i + 1])),
+                'rule{0}'.format(rng.choice([i, i, i, i + 2])),
+                'id{0}'.format(rng.choice([i, i, i, i + 3]))
+            )))
+    rng.shuffle(entries)
+    return entries
+
+
+class DuplicateIndexTest(unittest.TestCase):
+    def test_same_entry_everywhere_is_not_a_duplicate(self):
+        index = DuplicateIndex(SERVERS)
+        for server in SERVERS:
+            index.add(server, [Entry('uid=a,cn=users', 'a', 'id1')])
+
+        self.assertEqual(collisions(index), dict())
+        self.assertEqual(len(index), 1)
+
+    def test_one_cn_with_two_ids(self):
+        index = DuplicateIndex(SERVERS, by_cn=True)
+        index.add('ipa01', [Entry('ipaUniqueID=id1,cn=hbac', 'allow_all', 'id1')])
+        index.add('ipa02', [Entry('ipaUniqueID=id1,cn=hbac', 'allow_all', 'id1'),
+                            Entry('ipaUniqueID=id2,cn=hbac', 'allow_all', 'id2')])
+
+        self.assertEqual(collisions(index), {
+            'allow_all': {
+                'identifiers': set(['id1', 'id2']),
+                'servers': {'ipa01': set(['id1']), 'ipa02': set(['id1', 'id2'])},
+                'dn': {'ipauniqueid=id1,cn=hbac': set(['id1']), 'ipauniqueid=id2,cn=hbac': set(['id2'])}
+            }
+        })
+
+    def test_add_and_update_match_the_reference(self):
+        rng = random.Random(0)
+        for _ in range(500):
+            entries = random_entries(rng)
+            for by_cn in [False, True]:
+                expected = reference(entries, by_cn)
+
+                index = DuplicateIndex(SERVERS, by_cn=by_cn)
+                for server, entry in entries:
+                    index.add(server, [entry])
+                self.assertEqual(collisions(index), expected)
+
+                # Streamed checks fill one index per server and merge them.
+                merged = DuplicateIndex(SERVERS, by_cn=by_cn)
+                for server in SERVERS:
+                    own = DuplicateIndex(SERVERS, by_cn=by_cn)
+                    own.add(server, [entry for name, entry in entries if name == server])
+                    merged.update(own)
+                self.assertEqual(collisions(merged), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
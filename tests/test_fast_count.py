@@ -0,0 +1,45 @@
+import unittest
+
+from directory import DOMAIN, generate
+from fakeldap import install
+
+from checkipaconsistency.main import Main
+
+
+def run(directories, check, *args):
+    argv = ['-d', DOMAIN, '-D', 'cn=Directory Manager', '-W', 'test', '-n', check, '-H']
+    argv += [directory.host for directory in directories]
+    main = Main(argv + list(args))
+    main._compute_data()
+    return main
+
+
+class FastCountTest(unittest.TestCase):
+    def test_mixed_children_are_not_counted_as_rules(self):
+        # cn=hbac also holds the cn=hbacservices and cn=hbacservicegroups
+        # containers, so its numSubordinates is not the number of rules.
+        directories, _ = generate(replicas=2, users=200, missing=0, duplicates=0)
+        rules = len([key for key in directories[0].children['cn=hbac,' + directories[0].base_dn]
+                     if key.startswith('ipauniqueid=')])
+
+        with install(directories):
+            main = run(directories, 'hbac', '--fast-count')
+
+        self.assertNotIn('hbac', main._counts)
+        for server in main._data['checks']['hbac']['servers'].values():
+            self.assertEqual(server['result'], rules)
+        self.assertTrue(main._data['checks']['hbac']['status_item_count'])
+
+    def test_users_still_use_subordinates(self):
+        directories, _ = generate(replicas=2, users=200, missing=0, duplicates=0)
+
+        with install(directories):
+            main = run(directories, 'users', '--fast-count')
+
+        self.assertIn('users', main._counts)
+        for server in main._data['checks']['users']['servers'].values():
+            self.assertEqual(server['result'], 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
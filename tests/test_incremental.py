@@ -0,0 +1,46 @@
+import shutil
+import tempfile
+import unittest
+
+from directory import generate
+from fakeldap import install
+
+from checkipaconsistency.freeipaserver import FreeIPAServer
+from tests.test_fast_count import run
+
+
+class IncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = tempfile.mkdtemp()
+        self.calls = list()
+        self.sync = FreeIPAServer.sync
+
+        def sync(server, check, snapshot, *args):
+            self.calls.append(bool(snapshot.get('mark')))
+            return self.sync(server, check, snapshot, *args)
+
+        FreeIPAServer.sync = sync
+
+    def tearDown(self):
+        FreeIPAServer.sync = self.sync
+        shutil.rmtree(self.cache)
+
+    def test_mixed_children_do_not_force_a_full_sync(self):
+        # numSubordinates of cn=hbac also counts its service containers, so it
+        # never matches the rules and must not be used to reconcile them.
+        directories, _ = generate(replicas=2, users=200, missing=0, duplicates=0)
+        rules = len([key for key in directories[0].children['cn=hbac,' + directories[0].base_dn]
+                     if key.startswith('ipauniqueid=')])
+
+        with install(directories):
+            run(directories, 'hbac', '--incremental', self.cache)
+            del self.calls[:]
+            main = run(directories, 'hbac', '--incremental', self.cache)
+
+        self.assertEqual(self.calls, [True, True])
+        for server in main._data['checks']['hbac']['servers'].values():
+            self.assertEqual(server['result'], rules)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+
+from directory import generate
+from fakeldap import install
+
+from tests.test_fast_count import run
+
+
+class LagTest(unittest.TestCase):
+    def test_epoch_last_update_is_unknown(self):
+        directories, _ = generate(replicas=2, users=100, missing=0, duplicates=0)
+        for directory in directories:
+            for dn, attrs in directory.entries.values():
+                if 'nsDS5ReplicaHost' in attrs:
+                    attrs['nsds5replicaLastUpdateEnd'] = [b'19700101000000Z']
+
+        with install(directories):
+            main = run(directories, 'replicas', '--lag')
+            main._close()
+
+        for consumers in main._data['meta']['lag']['agreements'].values():
+            self.assertTrue(consumers)
+            for agreement in consumers.values():
+                self.assertIsNone(agreement['last_update_age'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from checkipaconsistency.merge import ExternalSorter, missing
+
+
+def sorter(values, chunk_size=3):
+    r = ExternalSorter(chunk_size=chunk_size)
+    for value in values:
+        r.add(value)
+    return r
+
+
+class ExternalSorterTest(unittest.TestCase):
+    def test_spilled_runs_are_merged_in_order(self):
+        values = [u'uid=user{0:02d},cn=users'.format(i) for i in range(20, 0, -1)]
+        values += [u'uid=zoë,cn=users', u'uid=user05,cn=users']
+        r = sorter(values)
+
+        self.assertTrue(r._runs)
+        self.assertEqual(list(r), sorted(set(values)))
+
+    def test_missing_across_spilled_streams(self):
+        common = [u'uid=user{0:02d},cn=users'.format(i) for i in range(10)]
+        streams = {
+            'ipa01': sorter(common + [u'uid=only01,cn=users']),
+            'ipa02': sorter(common[1:] + [u'uid=onlyä02,cn=users'])
+        }
+
+        self.assertEqual(missing(streams), {
+            'ipa01': [u'uid=onlyä02,cn=users'],
+            'ipa02': [u'uid=only01,cn=users', u'uid=user00,cn=users']
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+
+from directory import generate
+from fakeldap import install
+
+from tests.test_fast_count import run
+
+
+class PrefetchTest(unittest.TestCase):
+    def test_prefetched_failure_is_cached_as_an_error(self):
+        directories, _ = generate(replicas=2, users=100, missing=0, duplicates=0)
+        base = 'cn=dns,' + directories[0].base_dn
+        directories[0].remove(base)
+
+        with install(directories):
+            main = run(directories, 'zones', '--pipeline', '--error-ttl', '0')
+            payload = main._servers[directories[0].host]
+
+            # With --error-ttl 0 a failed search is not served from the cache.
+            misses = payload.cache.misses['zones']
+            self.assertIs(payload.zones, False)
+            self.assertEqual(payload.cache.misses['zones'], misses + 1)
+            main._close()
+
+
+if __name__ == '__main__':
+    unittest.main()
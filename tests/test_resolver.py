@@ -0,0 +1,57 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from checkipaconsistency.resolver import Resolver
+
+
+class ResolverCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_concurrent_saves(self):
+        path = os.path.join(self.directory, 'dns.json')
+        resolver = Resolver(cache_file=path)
+        errors = list()
+
+        def save(i):
+            try:
+                for j in range(20):
+                    with resolver._lock:
+                        resolver._cache['host{0}-{1} SRV'.format(i, j)] = {
+                            'expires': time.time() + 60,
+                            'answers': []
+                        }
+                    resolver._save()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=save, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        with open(path) as f:
+            self.assertEqual(len(json.load(f)), 160)
+        self.assertEqual(os.listdir(self.directory), ['dns.json'])
+
+    def test_unwritable_cache_is_ignored(self):
+        blocker = os.path.join(self.directory, 'file')
+        open(blocker, 'w').close()
+        resolver = Resolver(cache_file=os.path.join(blocker, 'dns.json'))
+        resolver._cache['host SRV'] = {'expires': time.time() + 60, 'answers': []}
+
+        resolver._save()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from directory import generate
+from fakeldap import compile_filter, install
+
+from checkipaconsistency.certs import encode_serial
+from checkipaconsistency.shards import merge, prefix_filters, serial_filters
+from tests.test_fast_count import run
+
+
+def matches(filters, attrs):
+    return [fltr for fltr in filters if compile_filter(fltr)(attrs)]
+
+
+class ShardsTest(unittest.TestCase):
+    def test_prefix_shards_cover_every_value_once(self):
+        values = ['alice', 'zed', '0day', '9lives', '_svc', '-x', u'\xe9mile', 'A', 'Z']
+        for shards in [1, 2, 3, 7, 36, 50]:
+            filters = prefix_filters('uid', shards)
+            self.assertLessEqual(len(filters), max(1, min(shards, 36)))
+            for value in values:
+                self.assertEqual(len(matches(filters, {'uid': [value.encode('utf-8')]})), 1, (shards, value))
+            self.assertEqual(len(matches(filters, {'cn': [b'no uid']})), 1)
+
+    def test_serial_shards_cover_every_serial_once(self):
+        for highest, shards in [(0, 4), (1, 4), (99, 4), (1000, 7), (12345, 16)]:
+            filters = serial_filters(highest, shards)
+            # The last shard stays open for certificates issued since.
+            for serial in list(range(0, min(highest, 300) + 1)) + [highest, highest + 1, highest * 10 + 5]:
+                attrs = {'serialno': [encode_serial(serial).encode('utf-8')]}
+                self.assertEqual(len(matches(filters, attrs)), 1, (highest, shards, serial))
+
+    def test_merge_rejects_an_entry_in_two_shards(self):
+        a = ('uid=a,cn=users', dict())
+        b = ('uid=b,cn=users', dict())
+
+        self.assertEqual(merge([[a], [], [b]]), [a, b])
+        self.assertIsNone(merge([[a], [('UID=A,cn=users', dict())]]))
+
+    def test_sharded_searches_match_the_single_search(self):
+        directories, _ = generate(replicas=2, users=300, missing=0.02, duplicates=0)
+
+        with install(directories) as network:
+            single = run(directories, 'users')
+            single._close()
+        with install(directories) as sharded_network:
+            sharded = run(directories, 'users', '--shards', '4', '--pool-size', '4')
+            sharded._close()
+
+        # Four shards and the count that verifies them, instead of one search.
+        self.assertEqual(sharded_network.searches - network.searches, 2 * 4)
+        self.assertEqual(sharded._data['checks']['users'], single._data['checks']['users'])
+        self.assertTrue(single._data['checks']['users']['servers'][directories[0].host].get('missing_dn') or
+                        single._data['checks']['users']['servers'][directories[1].host].get('missing_dn'))
+
+
+if __name__ == '__main__':
+    unittest.main()
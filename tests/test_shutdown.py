@@ -0,0 +1,67 @@
+import signal
+import sys
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from directory import DOMAIN, generate
+from fakeldap import install
+
+from checkipaconsistency.main import Daemon, Main
+from tests import fakedns
+
+
+def argv(directories, *args):
+    r = ['-d', DOMAIN, '-D', 'cn=Directory Manager', '-W', 'test', '--pool-size', '2'] + list(args)
+    return r + ['-H'] + [directory.host for directory in directories]
+
+
+class ShutdownTest(unittest.TestCase):
+    def setUp(self):
+        fakedns.install(self)
+
+    def test_run_closes_its_connections(self):
+        directories, _ = generate(replicas=2, users=100, missing=0, duplicates=0)
+
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            with install(directories) as network:
+                Main(argv(directories, '-o', 'json')).run()
+        finally:
+            sys.stdout = stdout
+
+        self.assertTrue(network.connections)
+        self.assertEqual(network.open, 0)
+
+    def test_stopped_daemon_closes_its_connections(self):
+        directories, _ = generate(replicas=2, users=100, missing=0, duplicates=0)
+        cycles = list()
+
+        with install(directories) as network:
+            daemon = Daemon(argv(directories, '--port', '0'))
+            run_cycle = daemon._run_cycle
+
+            def interrupt(checks):
+                if cycles:
+                    raise KeyboardInterrupt()
+                cycles.append(checks)
+                run_cycle(checks)
+                self.assertTrue(network.open)
+                daemon._intervals = dict((check, 0) for check in checks)
+
+            daemon._run_cycle = interrupt
+            handler = signal.getsignal(signal.SIGTERM)
+            try:
+                self.assertRaises(KeyboardInterrupt, daemon.run)
+            finally:
+                signal.signal(signal.SIGTERM, handler)
+
+        self.assertEqual(network.open, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
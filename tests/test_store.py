@@ -0,0 +1,59 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from checkipaconsistency.main import Diff
+from checkipaconsistency.store import Store
+
+
+def data(result):
+    return {
+        'checks': {
+            'users': {
+                'servers': {'ipa01': {'result': result}},
+                'status_item_count': True
+            }
+        }
+    }
+
+
+class StoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'runs.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_diff_defaults_to_the_latest_run_of_the_same_domain(self):
+        store = Store(self.path)
+        store.save_run('corp.example.com', data(10), dict())
+        store.save_run('lab.example.com', data(3), dict())
+        store.save_run('corp.example.com', data(12), dict())
+        store.save_run('lab.example.com', data(4), dict())
+        store.close()
+
+        argv, stdout = sys.argv, sys.stdout
+        sys.argv = ['cipa', 'diff', '--since', '1', '--store', self.path, '-o', 'json']
+        sys.stdout = StringIO()
+        try:
+            Diff().run()
+            output = sys.stdout.getvalue()
+        finally:
+            sys.argv, sys.stdout = argv, stdout
+
+        r = json.loads(output)
+        self.assertEqual(r['until'], 3)
+        self.assertEqual(r['checks']['users']['servers']['ipa01']['result'], [10, 12])
+
+
+if __name__ == '__main__':
+    unittest.main()
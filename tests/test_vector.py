@@ -0,0 +1,42 @@
+import random
+import unittest
+
+from checkipaconsistency.entry import Entry
+from checkipaconsistency.vector import HashCollision, load_numpy, missing_dns, set_missing, vector_missing
+
+
+def as_sets(missing_dn):
+    return dict((server, set(dns)) for server, dns in missing_dn.items())
+
+
+def random_servers(rng, replicas):
+    dns = ['uid=user{0},cn=users,dc=example,dc=com'.format(i) for i in range(rng.randint(0, 200))]
+    servers = dict()
+    for i in range(replicas):
+        servers['ipa{0:02d}'.format(i)] = [Entry(dn) for dn in dns if rng.random() > 0.05]
+    return servers
+
+
+@unittest.skipIf(load_numpy() is None, 'NumPy is not installed')
+class VectorTest(unittest.TestCase):
+    def test_vector_matches_sets(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            servers = random_servers(rng, rng.randint(1, 4))
+            self.assertEqual(as_sets(vector_missing(servers)), as_sets(set_missing(servers)))
+
+    def test_repeated_dn_falls_back_to_sets(self):
+        servers = {
+            'ipa01': [Entry('uid=a,cn=users'), Entry('uid=a,cn=users'), Entry('uid=b,cn=users')],
+            'ipa02': [Entry('uid=a,cn=users')]
+        }
+
+        self.assertRaises(HashCollision, vector_missing, servers)
+        self.assertEqual(as_sets(missing_dns(servers, threshold=1)), {
+            'ipa01': set(),
+            'ipa02': set(['uid=b,cn=users'])
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()